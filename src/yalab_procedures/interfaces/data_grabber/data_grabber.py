@@ -1,3 +1,4 @@
+import copy
 import json
 from pathlib import Path
 
@@ -5,6 +6,10 @@ from nipype.interfaces import io as nio
 
 DEFAULT_OUTPUT_QUERY = Path(__file__).parent / "default_bids_query.json"
 
+# The default query is static, so parse it once at import time
+with open(DEFAULT_OUTPUT_QUERY, "r") as _query_file:
+    _DEFAULT_OUTPUT_QUERY_CACHE = json.load(_query_file)
+
 
 class YALabBidsQuery(nio.BIDSDataGrabber):
     """
@@ -19,6 +24,4 @@ class YALabBidsQuery(nio.BIDSDataGrabber):
         """
         Update the output query with the default query.
         """
-        with open(DEFAULT_OUTPUT_QUERY, "r") as f:
-            output_query = json.load(f)
-        self.inputs.output_query.update(output_query)
+        self.inputs.output_query.update(copy.deepcopy(_DEFAULT_OUTPUT_QUERY_CACHE))
@@ -0,0 +1,247 @@
+import functools
+import hashlib
+import os
+import os.path as op
+from concurrent.futures import ThreadPoolExecutor
+from importlib.metadata import version
+from typing import Any, Callable, Dict, List, Optional
+
+from nipype.interfaces.base import isdefined
+
+from yalab_procedures.procedures.base.procedure import Procedure, _available_cpus
+
+
+@functools.lru_cache(maxsize=None)
+def _package_version(package: str) -> str:
+    """
+    Returns the installed version of a distribution.
+    """
+    return version(package)
+
+
+class _PackageVersion:
+    """
+    Resolves a procedure's version from its package's metadata on first use, so
+    defining or importing the procedure does not require the package.
+    """
+
+    def __get__(self, instance: Any, owner: type) -> str:
+        if owner._package is None:
+            return Procedure._version
+        return _package_version(owner._package)
+
+
+class NiPrepsProcedure(Procedure):
+    """
+    Base class for procedures that run a NiPreps-style package (e.g. KePrep or
+    KePost) in-process, through its config module and nipype workflow.
+
+    Subclasses set the package name and configuration mapping, and implement
+    ``_run_workflow`` and ``_generate_reports``.
+    """
+
+    # Distribution whose version tags the procedure's runs
+    _package: Optional[str] = None
+    # Mapping of input names to the package's configuration keys
+    _inputs_mapping: Dict[str, str] = {}
+    # Configuration key of the package's SQLite index and its default location
+    # (relative to the work directory)
+    _database_dir_key: Optional[str] = None
+    _database_dir_name: Optional[str] = None
+    _version = _PackageVersion()  # type: ignore[assignment]
+
+    def __init__(self, **inputs: Any):
+        super().__init__(**inputs)
+        # Resolved per instance so affinity/cgroup limits of this process apply
+        if not isdefined(self.inputs.nprocs):
+            self.inputs.nprocs = _available_cpus()
+
+    def run_procedure(self, **kwargs):
+        """
+        Run the package's workflow and generate its reports
+
+        Raises
+        ------
+        FileNotFoundError
+            If the input directory does not exist.
+        ValueError
+            If the FreeSurfer license file or a required input is missing.
+        """
+        self.logger.info(f"Running {self.__class__.__name__}")
+        self.logger.debug("Input attributes: %s", kwargs)
+        # Validated once here rather than on every assignment of the trait
+        if not op.isdir(self.inputs.input_directory):
+            raise FileNotFoundError(
+                f"Input directory not found: {self.inputs.input_directory}"
+            )
+
+        if self._check_output_directory():
+            return
+        # Locate the FreeSurfer license file
+        self._locate_fs_license_file()
+        # Markers left by an earlier run must not survive a rerun that fails
+        for marker in self._completion_markers:
+            if op.exists(marker):
+                os.remove(marker)
+
+        configuration_dict = self._setup_config_toml()
+        workflow = self._run_workflow(configuration_dict)
+        self._generate_reports(workflow=workflow, configuration_dict=configuration_dict)
+        for marker in self._completion_markers:
+            open(marker, "w").close()
+
+    def _run_workflow(self, configuration_dict: Dict[str, Any]) -> Any:
+        """
+        Load the configuration into the package, then build and run its workflow
+
+        Returns
+        -------
+        Workflow
+            The workflow that was run
+        """
+        raise NotImplementedError("Subclasses should implement this method")
+
+    def _execute_workflow(self, workflow: Any, config: Any):
+        """
+        Run a built workflow with the nipype plugin of the package's configuration,
+        so both packages follow the same execution policy (MultiProc over
+        ``nprocs`` unless configured otherwise)
+        """
+        workflow.run(**config.nipype.get_plugin())
+
+    def _generate_reports(self, workflow: Any, configuration_dict: Dict[str, Any]):
+        """
+        Generate the boilerplate and the per-subject reports of a run
+        """
+        raise NotImplementedError("Subclasses should implement this method")
+
+    def _setup_config_toml(self) -> Dict[str, Any]:
+        """
+        Set up the configuration file
+        """
+        defaults = self._input_defaults()
+        configuration_dict = {}
+        for key, value in self.inputs.get().items():
+            target_key = self._inputs_mapping.get(key, key)
+            if isdefined(value):
+                configuration_dict[target_key] = value
+            elif key in self._inputs_mapping:
+                # Mapped inputs are required, falling back to the trait default
+                value = defaults[key]
+                if not isdefined(value):
+                    raise ValueError(f"Value for {key} not provided.")
+                configuration_dict[target_key] = value
+        # Keep the SQLite index in the work directory so reruns reuse it. It is
+        # keyed on the input dataset and its mtime, so a different dataset or an
+        # added/removed subject gets a fresh index instead of a stale one.
+        key = self._database_dir_key
+        if key is not None and key not in configuration_dict:
+            input_directory = op.abspath(self.inputs.input_directory)
+            dataset = f"{input_directory}:{os.stat(input_directory).st_mtime_ns}"
+            database_dir = op.join(
+                configuration_dict["work_dir"],
+                self._database_dir_name,
+                hashlib.sha1(dataset.encode()).hexdigest()[:16],
+            )
+            os.makedirs(database_dir, exist_ok=True)
+            configuration_dict[key] = database_dir
+        return configuration_dict
+
+    def _run_reports(
+        self,
+        run_reports: Callable[..., Any],
+        reports_directory: str,
+        run_uuid: str,
+        bootstrap_file: Any,
+    ):
+        """
+        Run the package's ``run_reports`` for every participant, logging the
+        subjects whose report failed
+        """
+        participant_labels = list(self.inputs.participant_label)
+
+        def _run_subject_report(participant_label: str):
+            return run_reports(
+                reports_directory,
+                participant_label,
+                run_uuid,
+                bootstrap_file=bootstrap_file,
+                out_filename="report.html",
+                reportlets_dir=reports_directory,
+                errorname=f"report-{run_uuid}-{participant_label}.err",
+                subject=participant_label,
+            )
+
+        # Reports are independent per subject and mostly IO-bound
+        max_workers = max(1, min(self.inputs.nprocs, len(participant_labels)))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            errors = list(executor.map(_run_subject_report, participant_labels))
+        failed = [label for label, err in zip(participant_labels, errors) if err]
+        if failed:
+            self.logger.warning(
+                "Failed to generate report for subjects: %s", ", ".join(failed)
+            )
+
+    @property
+    def _completion_markers(self) -> List[str]:
+        """
+        Files written to the output directory once the workflow and the reports
+        of a run have finished: one per participant, or a single one for a run
+        over the whole dataset
+        """
+        name = self.__class__.__name__
+        participant_labels = self.inputs.participant_label
+        if not isdefined(participant_labels) or not participant_labels:
+            return [op.join(self.inputs.output_directory, f".{name}.complete")]
+        return [
+            op.join(
+                self.inputs.output_directory,
+                f".{name}.sub-{label.removeprefix('sub-')}.complete",
+            )
+            for label in participant_labels
+        ]
+
+    # function to avoid rerunning if force is not set
+    def _check_output_directory(self) -> bool:
+        """
+        Check if a previous run into the output directory has finished
+
+        Returns
+        -------
+        bool
+            True if the completion markers of all requested participants exist
+            and force is not set
+        """
+        if self.inputs.force:
+            return False
+        self.logger.info(
+            f"Attempting to locate outputs from previous run in {self.inputs.output_directory}"  # noqa: E501
+        )
+        if all(op.exists(marker) for marker in self._completion_markers):
+            self.logger.info(
+                f"Outputs already exist in {self.inputs.output_directory}. If you want to run the procedure again, set force=True."  # noqa: E501
+            )
+            return True
+        return False
+
+    def _locate_fs_license_file(self):
+        """
+        Locate the FreeSurfer license file
+        """
+        if not isdefined(self.inputs.fs_license_file):
+            fs_home = os.getenv("FREESURFER_HOME")
+            if fs_home is None:
+                raise ValueError(
+                    "FREESURFER_HOME environment variable is not set and fs_license_file is not provided."  # noqa: E501
+                )
+            fs_license_file = op.join(fs_home, "license.txt")
+            if not op.exists(fs_license_file):
+                raise ValueError(
+                    f"FreeSurfer license file not found at {fs_license_file}"
+                )
+            self.inputs.fs_license_file = fs_license_file
+
+    def _list_outputs(self):
+        outputs = self.output_spec().get()
+        outputs["output_directory"] = op.abspath(self.inputs.output_directory)
+        return outputs
@@ -1,8 +1,30 @@
+import atexit
+import functools
+import itertools
 import json
 import logging
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
 from datetime import datetime
+from logging.handlers import MemoryHandler, QueueHandler, QueueListener
 from pathlib import Path
-from typing import Any, Dict, Union
+from subprocess import PIPE, CalledProcessError, CompletedProcess, Popen
+from typing import (
+    IO,
+    Any,
+    Callable,
+    DefaultDict,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
 
 from nipype.interfaces.base import (
     BaseInterface,
@@ -14,6 +36,227 @@ from nipype.interfaces.base import (
 )
 
 
+def _json_default(value: Any) -> Any:
+    """
+    Serializes the input values that JSON does not support natively.
+    """
+    if isinstance(value, Path):
+        return str(value)
+    if not isdefined(value):
+        return None
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+try:
+    import orjson
+
+    _json_loads = orjson.loads
+
+    def _json_dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj, default=_json_default, option=orjson.OPT_INDENT_2)
+
+except ImportError:  # pragma: no cover
+    _json_loads = json.loads
+
+    def _json_dumps(obj: Any) -> bytes:
+        return json.dumps(obj, default=_json_default, indent=2).encode()
+
+
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+LOG_BUFFER_CAPACITY = 1024
+LOGGING_LEVELS = {
+    "DEBUG": logging.DEBUG,
+    "INFO": logging.INFO,
+    "WARNING": logging.WARNING,
+    "ERROR": logging.ERROR,
+    "CRITICAL": logging.CRITICAL,
+}
+
+# Log filenames share the process start time, the process ID (forked workers
+# inherit the first two) and a per-class counter
+_RUN_TIMESTAMP = time.strftime("%Y%m%d_%H%M%S")
+_LOG_FILE_COUNTERS: DefaultDict[str, Iterator[int]] = defaultdict(itertools.count)
+
+
+class _ProcedureQueueHandler(QueueHandler):
+    """
+    Queues records for the shared log listener, tagged with the handler that
+    writes them to the procedure's log file.
+    """
+
+    def __init__(self, target: logging.Handler):
+        super().__init__(_LOG_QUEUE)
+        self.target = target
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = super().prepare(record)
+        record.log_target = self.target
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        # Look the queue up on each call: a forked child replaces it
+        _LOG_QUEUE.put_nowait(record)
+
+
+class _ProcedureLogListener(QueueListener):
+    """
+    Writes the queued records of all procedures from one background thread.
+    """
+
+    def __init__(self, log_queue: queue.SimpleQueue):
+        super().__init__(log_queue)
+        self._unflushed: Set[logging.Handler] = set()
+
+    def handle(self, record: Any):
+        # An event is a flush request: everything queued before it is written
+        if isinstance(record, threading.Event):
+            self._flush()
+            record.set()
+            return
+        target = record.log_target
+        if record.levelno >= target.level:
+            target.handle(record)
+            self._unflushed.add(target)
+        # Write out each batch once the queue is drained, so log files keep up
+        # with a running procedure without a write per record
+        if self.queue.empty():
+            self._flush()
+
+    def _flush(self):
+        for target in self._unflushed:
+            target.flush()
+        self._unflushed.clear()
+
+
+# A single listener thread serves every procedure in the process. It runs only
+# while at least one log file is open.
+_LOG_QUEUE: queue.SimpleQueue = queue.SimpleQueue()
+_LOG_LISTENER = _ProcedureLogListener(_LOG_QUEUE)
+_LOG_LISTENER_LOCK = threading.Lock()
+_LOG_TARGETS: Set[logging.Handler] = set()
+
+
+def _open_log_target(target: logging.Handler):
+    """
+    Registers a log file handler, starting the shared listener if needed.
+    """
+    with _LOG_LISTENER_LOCK:
+        _LOG_TARGETS.add(target)
+        if _LOG_LISTENER._thread is None:
+            _LOG_LISTENER.start()
+
+
+def _close_log_target(target: logging.Handler):
+    """
+    Writes the records queued so far, closes a log file handler and stops the
+    shared listener once no log file is left open.
+    """
+    with _LOG_LISTENER_LOCK:
+        if target not in _LOG_TARGETS:
+            return
+        flushed = threading.Event()
+        _LOG_QUEUE.put(flushed)
+        flushed.wait()
+        _LOG_TARGETS.discard(target)
+        if not _LOG_TARGETS:
+            _LOG_LISTENER.stop()
+    # Closing a MemoryHandler flushes it, but leaves its target open
+    target.close()
+    if isinstance(target, MemoryHandler) and target.target is not None:
+        target.target.close()
+
+
+@atexit.register
+def _close_log_targets():
+    """
+    Flushes and closes the log files still open at interpreter shutdown.
+    """
+    for target in list(_LOG_TARGETS):
+        _close_log_target(target)
+
+
+def _reset_log_listener_after_fork():
+    """
+    Gives a forked child its own queue, lock and listener. The parent's listener
+    thread does not exist in the child, and the records queued or buffered
+    before the fork are the parent's to write.
+    """
+    global _LOG_QUEUE, _LOG_LISTENER, _LOG_LISTENER_LOCK
+    _LOG_QUEUE = queue.SimpleQueue()
+    _LOG_LISTENER = _ProcedureLogListener(_LOG_QUEUE)
+    _LOG_LISTENER_LOCK = threading.Lock()
+    for target in _LOG_TARGETS:
+        if isinstance(target, MemoryHandler):
+            target.buffer.clear()
+    # Log files inherited from the parent stay usable in the child
+    if _LOG_TARGETS:
+        _LOG_LISTENER.start()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_log_listener_after_fork)
+
+
+@functools.lru_cache(maxsize=256)
+def _as_path(path: str) -> Path:
+    """
+    Converts a string to a Path, reusing the (immutable) object for repeated paths.
+    """
+    return Path(path)
+
+
+def _available_cpus() -> int:
+    """
+    Returns the number of CPUs this process may run on, honouring affinity masks
+    (taskset, SLURM, cgroup cpusets) where the platform exposes them.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def _read_json(path: Union[str, Path]) -> Dict[str, Any]:
+    """
+    Reads a JSON file.
+    """
+    with open(path, "rb") as f:
+        return _json_loads(f.read())
+
+
+# Parsed done-files, keyed on path and valid while the file's inode, mtime and
+# size are unchanged. Done-files are replaced rather than rewritten in place, so
+# every write gives them a new inode.
+_FINISHED_FILES: Dict[str, Tuple[Tuple[int, int, int], Dict[str, Any]]] = {}
+
+
+def _read_finished_file(path: Union[str, Path]) -> Dict[str, Any]:
+    """
+    Reads a done-file, reusing the previous parse while the file is unchanged.
+    Callers must not modify the result.
+    """
+    path = str(path)
+    stat = os.stat(path)
+    key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    cached = _FINISHED_FILES.get(path)
+    if cached is None or cached[0] != key:
+        cached = _FINISHED_FILES[path] = (key, _read_json(path))
+    return cached[1]
+
+
+def _forward_stream(
+    stream: IO[str],
+    log: Callable[[str], None],
+    lines: Optional[List[str]] = None,
+):
+    """
+    Logs each line of a stream as it arrives, optionally keeping a copy.
+    """
+    for line in stream:
+        log(line.rstrip("\n"))
+        if lines is not None:
+            lines.append(line)
+
+
 class ProcedureInputSpec(BaseInterfaceInputSpec):
     input_directory = Directory(
         exists=True, mandatory=True, desc="Input directory"
@@ -47,35 +290,87 @@ class Procedure(BaseInterface):
     output_spec = ProcedureOutputSpec
     _version = "0.0.1"
 
+    _logger: Optional[logging.Logger] = None
+    _parsed_inputs: Optional[Dict[Tuple[str, ...], List[str]]] = None
+    _sessions_cache: Optional[Tuple[Tuple[str, int], List[str]]] = None
+    # Set whenever an input changes, e.g. when a procedure infers a missing input
+    _inputs_changed = False
+
     def __init__(self, **inputs: Any):
         super().__init__(**inputs)
+        self.inputs.on_trait_change(self._clear_parsed_inputs)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Runtime-only state is rebuilt on demand after a copy or unpickle
+        state = self.__dict__.copy()
+        for key in ("_parsed_inputs", "_logger", "_log_target", "_log_queue_handler"):
+            state.pop(key, None)
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]):
+        self.__dict__.update(state)
+        self.inputs.on_trait_change(self._clear_parsed_inputs)
+
+    def _parse_inputs(self, skip=None) -> List[str]:
+        """
+        Parses the command line arguments, reusing the previous result until an
+        input changes. Results are kept per set of skipped inputs. Only used by
+        procedures that are also a CommandLine.
+        """
+        key = tuple(skip) if skip else ()
+        if self._parsed_inputs is None:
+            self._parsed_inputs = {}
+        if key not in self._parsed_inputs:
+            self._parsed_inputs[key] = super()._parse_inputs(skip)  # type: ignore[misc]
+        return list(self._parsed_inputs[key])
+
+    def _clear_parsed_inputs(self):
+        """
+        Invalidates the cached command line arguments and marks the inputs as
+        changed.
+        """
+        self._parsed_inputs = None
+        self._inputs_changed = True
+
+    @property
+    def logger(self) -> logging.Logger:
+        """
+        The procedure's logger. Logging is set up on first use, so procedures that
+        are only inspected (e.g. for their command line) never create a log file.
+        Once logging is stopped, records propagate to the root logger.
+        """
+        if self._logger is None:
+            self.setup_logging()
+        return self._logger  # type: ignore[return-value]
 
     def _run_interface(self, runtime) -> Any:
         """
         Executes the interface, setting up logging and calling the procedure.
         """
-        # Validate directories and set up logging
-        if not isdefined(self.inputs.logging_directory):
-            self.inputs.logging_directory = (
-                Path(self.inputs.output_directory).parent / "logs"
-            )
-
+        # Set up logging for this run
         self.setup_logging()
+        try:
+            # Check if the procedure has already been run
+            finished_file, proceed = self._check_old_runs_finished()
+            if not proceed:
+                return runtime
 
-        # Check if the procedure has already been run
-        finished_file, proceed = self._check_old_runs_finished()
-        if not proceed:
-            return runtime
-
-        self.logger.info(
-            f"Running procedure with input directory: {self.inputs.input_directory}"  # noqa: E501
-        )
-        # Run the custom procedure
-        self.run_procedure(**self.inputs.get())
-        self.logger.info(
-            f"Procedure completed. Output directory: {self.inputs.output_directory}"  # noqa: E501
-        )
-        self._write_finished_file(finished_file)
+            self.logger.info(
+                f"Running procedure with input directory: {self.inputs.input_directory}"  # noqa: E501
+            )
+            # Run the custom procedure
+            inputs = self.inputs.get()
+            self._inputs_changed = False
+            self.run_procedure(**inputs)
+            self.logger.info(
+                f"Procedure completed. Output directory: {self.inputs.output_directory}"  # noqa: E501
+            )
+            # Record the inputs as the procedure left them (e.g. inferred IDs)
+            if self._inputs_changed:
+                inputs = self.inputs.get()
+            self._write_finished_file(finished_file, inputs)
+        finally:
+            self.stop_logging()
 
         return runtime
 
@@ -85,60 +380,59 @@ class Procedure(BaseInterface):
         """
         # set up a "finished" file to keep track of when the procedure was last run # noqa: E501
         finished_file = (
-            Path(self.inputs.logging_directory)
+            _as_path(str(self.inputs.logging_directory))
             / f"{type(self).__name__}-{self._version}.done.json"
         )
         proceed = True
-        if finished_file.exists():
-            if self.inputs.force:
-                self.logger.info(
-                    f"Removing {finished_file} because force=True. Will run procedure again."  # noqa: E501
-                )
+        if self.inputs.force:
+            try:
                 finished_file.unlink()
+            except FileNotFoundError:
                 return finished_file, proceed
-            # read the timestamp of the last run from the file
-            with open(str(finished_file), "r") as f:
-                data = json.load(f)
-                timestamp = data["timestamp"]
-                config = data["config"]
             self.logger.info(
-                f"Procedure was last run on {timestamp}. Checking if the configuration is the same."  # noqa: E501
+                f"Removed {finished_file} because force=True. Will run procedure again."  # noqa: E501
             )
-            # check if the configuration is the same as the current configuration # noqa: E501
-            if self.inputs.output_directory == config["output_directory"]:
-                msg = "User requested to regenerate outputs in the same directory. Please change the output directory or set force=True."  # noqa: E501
-                self.logger.error(
-                    msg,
-                )
-                proceed = False
-            else:
-                proceed = True
+            return finished_file, proceed
+        # read the timestamp of the last run from the file
+        try:
+            data = _read_finished_file(finished_file)
+        except FileNotFoundError:
+            return finished_file, proceed
+        timestamp = data["timestamp"]
+        config = data["config"]
+        self.logger.info(
+            f"Procedure was last run on {timestamp}. Checking if the configuration is the same."  # noqa: E501
+        )
+        # check if the configuration is the same as the current configuration # noqa: E501
+        if self.inputs.output_directory == config["output_directory"]:
+            msg = "User requested to regenerate outputs in the same directory. Please change the output directory or set force=True."  # noqa: E501
+            self.logger.error(
+                msg,
+            )
+            proceed = False
         return finished_file, proceed
 
-    def _write_finished_file(self, finished_file: Union[str, Path]):
+    def _write_finished_file(
+        self, finished_file: Union[str, Path], inputs: Dict[str, Any]
+    ):
         """
-        Writes a "finished" file to keep track of when the procedure was last run. # noqa: E501
+        Writes a "finished" file to keep track of when the procedure was last run.
 
         Parameters
         ----------
         finished_file : Union[str, Path]
             The path to the finished file.
+        inputs : Dict[str, Any]
+            The inputs the procedure was run with.
         """
-        config_to_save = {}
-        # Fix JSON serialization issues
-        for key, value in self.inputs.get().items():
-            if isinstance(value, Path):
-                config_to_save[key] = str(value)
-            elif not isdefined(value):
-                config_to_save[key] = None  # type: ignore[assignment]
-            else:
-                config_to_save[key] = value
-        with open(str(finished_file), "w") as f:
-            json.dump(
-                {"timestamp": str(datetime.now()), "config": config_to_save},
-                f,  # noqa: E501
-                indent=6,
-            )
+        # Paths and undefined values are handled by _json_default
+        data = _json_dumps({"timestamp": str(datetime.now()), "config": inputs})
+        # Write next to the target and rename, so readers never see a partial file
+        tmp_file = f"{finished_file}.tmp"
+        with open(tmp_file, "wb") as f:
+            f.write(data)
+        os.replace(tmp_file, finished_file)
+        _FINISHED_FILES.pop(str(finished_file), None)
 
     def _check_same_configuration(self, config: Dict[str, Any]) -> bool:
         """
@@ -148,45 +442,177 @@ class Procedure(BaseInterface):
         current_config = self.inputs.get()
         return current_config == config
 
+    @classmethod
+    @functools.lru_cache(maxsize=None)
+    def _empty_outputs(cls) -> Dict[str, Any]:
+        """
+        Returns the output names of the procedure, all undefined. Cached per class,
+        so callers must copy the result before filling it in.
+        """
+        return cls.output_spec().get()
+
     def _list_outputs(self) -> Dict[str, str]:
         """
         Lists the outputs of the procedure.
         """
-        outputs = self._outputs().get()
+        outputs = dict(self._empty_outputs())
         outputs["output_directory"] = str(self.inputs.output_directory)
         outputs["log_file"] = str(self.log_file_path)
         return outputs
 
+    @classmethod
+    @functools.lru_cache(maxsize=None)
+    def _input_defaults(cls) -> Dict[str, Any]:
+        """
+        Returns the trait default of every input. Cached per class, so callers
+        must not modify the result.
+        """
+        spec = cls.input_spec()
+        return {name: spec.trait(name).default for name in spec.copyable_trait_names()}
+
+    def _get_default_value(self, key: str) -> Any:
+        """
+        Returns the value of an input, or its trait default if it is not defined.
+        """
+        value = getattr(self.inputs, key)
+        return value if isdefined(value) else self._input_defaults()[key]
+
+    @property
+    def sessions(self) -> List[str]:
+        """
+        Returns the session labels of the ses-* directories in the input directory,
+        or an empty list if the input directory is undefined or missing. The
+        listing is cached until the input directory or its mtime changes.
+        """
+        input_directory = self.inputs.input_directory
+        if not isdefined(input_directory):
+            return []
+        try:
+            key = (input_directory, os.stat(input_directory).st_mtime_ns)
+        except FileNotFoundError:
+            return []
+        if self._sessions_cache is None or self._sessions_cache[0] != key:
+            with os.scandir(input_directory) as entries:
+                sessions = [
+                    entry.name.rpartition("-")[2]
+                    for entry in entries
+                    if entry.name.startswith("ses-") and entry.is_dir()
+                ]
+            self._sessions_cache = (key, sessions)
+        return list(self._sessions_cache[1])
+
     def _gen_log_filename(self) -> str:
         """
-        Generates a log filename based on the procedure name and the current timestamp.
+        Generates a log filename based on the procedure name, the process start
+        timestamp, the process ID and a per-class counter that keep filenames
+        unique.
         """
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        return f"{self.__class__.__name__}_{timestamp}.log"
+        name = self.__class__.__name__
+        counter = next(_LOG_FILE_COUNTERS[name])
+        return f"{name}_{_RUN_TIMESTAMP}_{os.getpid()}_{counter}.log"
 
     def setup_logging(self):
         """
         Sets up logging configuration.
         """
-        # Reset logging configuration
-        for handler in logging.root.handlers[:]:
-            logging.root.removeHandler(handler)
+        # Validate directories
+        if not isdefined(self.inputs.logging_directory):
+            self.inputs.logging_directory = (
+                _as_path(str(self.inputs.output_directory)).parent / "logs"
+            )
 
         # Set up logging configuration
-        logging_dir = Path(self.inputs.logging_directory)
-        if not logging_dir.exists():
-            logging_dir.mkdir(parents=True, exist_ok=True)
+        logging_dir = _as_path(str(self.inputs.logging_directory))
+        logging_dir.mkdir(parents=True, exist_ok=True)
 
         log_file_path = logging_dir / self._gen_log_filename()
         self.log_file_path = log_file_path
-        logging.basicConfig(
-            filename=log_file_path,
-            level=getattr(logging, self.inputs.logging_level),
-            format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+
+        # Make sure a repeated setup does not leave a second handler behind
+        self.stop_logging()
+
+        # Write records from the shared background thread so logging never blocks
+        # on disk and batch the writes, flushing immediately on warnings
+        file_handler = logging.FileHandler(log_file_path)
+        file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        self._log_target = MemoryHandler(
+            LOG_BUFFER_CAPACITY, flushLevel=logging.WARNING, target=file_handler
+        )
+        self._log_queue_handler = _ProcedureQueueHandler(self._log_target)
+        _open_log_target(self._log_target)
+
+        # Each instance gets its own child of the class logger, so records of one
+        # procedure never reach another procedure's log file. It is left out of
+        # the logging registry, so it is collected together with the procedure.
+        self._logger = logging.Logger(f"{self.__class__.__name__}.{id(self)}")
+        self._logger.parent = logging.getLogger(self.__class__.__name__)
+        self._logger.addHandler(self._log_queue_handler)
+        self._logger.setLevel(
+            LOGGING_LEVELS.get(self.inputs.logging_level.upper(), logging.INFO)
         )
-        self.logger = logging.getLogger(self.__class__.__name__)
+        # Records are written by our own handler, don't write them again via root
+        self._logger.propagate = False
 
-        self.logger.debug(f"Logging setup complete. Log file: {log_file_path}")
+        self.logger.debug("Logging setup complete. Log file: %s", log_file_path)
+
+    def stop_logging(self):
+        """
+        Flushes pending log records and closes the log file.
+        """
+        target = getattr(self, "_log_target", None)
+        if target is None:
+            return
+        self._logger.removeHandler(self._log_queue_handler)
+        # Later records go to the application's handlers instead of being dropped
+        self._logger.propagate = True
+        _close_log_target(target)
+        self._log_target = None
+
+    def _run_command(self, command: List[str]) -> CompletedProcess:
+        """
+        Runs a command without a shell, streaming its output to the logger.
+
+        Parameters
+        ----------
+        command : List[str]
+            The command and its arguments.
+
+        Returns
+        -------
+        CompletedProcess
+            The finished process, with the captured stdout and stderr. Both have
+            also been written to the log as they arrived, and a non-zero return
+            code is logged as an error.
+
+        Raises
+        ------
+        CalledProcessError
+            If the command cannot be started, with return code 127.
+        """
+        stdout_lines: List[str] = []
+        stderr_lines: List[str] = []
+        try:
+            process = Popen(command, stdout=PIPE, stderr=PIPE, text=True, bufsize=1)
+        except OSError as error:
+            # Report a missing or non-executable program like a shell would (127)
+            self.logger.error("Failed to run %s: %s", command[0], error)
+            raise CalledProcessError(127, command, stderr=f"{error}\n") from error
+        with process:
+            # Tools write progress to stderr too, so its lines are not errors as such
+            stderr_reader = threading.Thread(
+                target=_forward_stream,
+                args=(process.stderr, self.logger.info, stderr_lines),
+                daemon=True,
+            )
+            stderr_reader.start()
+            _forward_stream(process.stdout, self.logger.info, stdout_lines)
+            stderr_reader.join()
+            returncode = process.wait()
+        if returncode:
+            self.logger.error("%s exited with return code %d", command[0], returncode)
+        return CompletedProcess(
+            command, returncode, "".join(stdout_lines), "".join(stderr_lines)
+        )
 
     def run_procedure(self, **kwargs):
         """
@@ -1,8 +1,11 @@
 # src/yalab_procedures/procedures/dicom_to_bids.py
 
+import logging
+import os
 import shlex
 from pathlib import Path
-from subprocess import CalledProcessError, run
+from subprocess import CalledProcessError
+from typing import List
 
 from nipype.interfaces.base import (
     CommandLine,
@@ -116,24 +119,18 @@ class DicomToBidsProcedure(Procedure, CommandLine):
 
         self.logger.info("Running DicomToBidsProcedure")
         self.infer_session_id()
-        # self.standardize_input_directory()
-        self.logger.debug(f"Input attributes: {kwargs}")
+        self.logger.debug("Input attributes: %s", kwargs)
 
         # Run the heudiconv command
         command = self.build_commandline()
-        result = run(
-            command,
-            shell=True,
-            check=False,
-            capture_output=True,
-            text=True,
-        )
-        self.logger.info(result.stdout)
+        result = self._run_command(command)
         if (
             result.stderr
             and "TypeError: 'NoneType' object is not iterable" not in result.stderr
         ):
-            self.logger.error(result.stderr)
+            if not result.returncode:
+                # Non-zero return codes are already logged by _run_command
+                self.logger.error("%s reported errors on stderr", command[0])
             raise CalledProcessError(
                 result.returncode, command, output=result.stdout, stderr=result.stderr
             )
@@ -145,31 +142,54 @@ class DicomToBidsProcedure(Procedure, CommandLine):
         This is useful for DICOM directories provided by TAU's MRI facility.
         """
         if not isdefined(self.inputs.session_id) and self.inputs.infer_session_id:
-            session_id = Path(self.inputs.input_directory).name.split("_")[-2:]
-            session_id = "".join(session_id)
-            self.inputs.session_id = session_id
+            name = os.path.basename(os.path.normpath(self.inputs.input_directory))
+            self.inputs.session_id = "".join(name.rsplit("_", 2)[-2:])
 
-    def standardize_input_directory(self):
+    def find_dicom_files(self) -> List[str]:
         """
-        Standardize the input directory path
-        """
-        self.inputs.input_directory = shlex.quote(str(self.inputs.input_directory))
+        Find the DICOM files in the input directory, as the shell would expand
+        the --files pattern. The pattern itself is kept if no files match.
 
-    def build_commandline(self) -> str:
+        Returns
+        -------
+        List[str]
+            The sorted DICOM file paths
+        """
+        input_directory = str(self.inputs.input_directory)
+        dicom_files = []
+        # Hidden entries are skipped, like the shell's * does
+        with os.scandir(input_directory) as series_entries:
+            for series in series_entries:
+                if series.name.startswith(".") or not series.is_dir():
+                    continue
+                with os.scandir(series.path) as file_entries:
+                    dicom_files += [
+                        entry.path
+                        for entry in file_entries
+                        if entry.name.endswith(".dcm")
+                        and not entry.name.startswith(".")
+                    ]
+        return sorted(dicom_files) or [os.path.join(input_directory, "*", "*.dcm")]
+
+    def build_commandline(self) -> List[str]:
         """
         Build the command line arguments for the heudiconv command
 
         Returns
         -------
-        str
-            The command line arguments as a string
+        List[str]
+            The command and its arguments, ready to run without a shell
         """
         # Build the command line arguments
-        cmd_args = self._parse_inputs()
-        cmd = [self._cmd] + cmd_args
-        self.logger.debug(f"Command line: {' '.join(cmd)}")
-        # Run the command
-        return " ".join(cmd)
+        cmd = [self._cmd]
+        for arg in self._parse_inputs(skip=["input_directory"]):
+            cmd += shlex.split(arg)
+        cmd += ["--files"] + self.find_dicom_files()
+        # Don't set up logging (and create a log file) just to build the command
+        logger = self._logger or logging.getLogger(self.__class__.__name__)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Command line: %s", shlex.join(cmd))
+        return cmd
 
     def _list_outputs(self):
         """
@@ -180,6 +200,6 @@ class DicomToBidsProcedure(Procedure, CommandLine):
         dict
             The outputs of the procedure
         """
-        outputs = self._outputs().get()
+        outputs = dict(self._empty_outputs())
         outputs["bids_directory"] = str(self.inputs.output_directory)
         return outputs
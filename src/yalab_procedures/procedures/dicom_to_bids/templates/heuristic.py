@@ -1,9 +1,18 @@
 from __future__ import annotations
 
+import logging
+import re
+from functools import lru_cache
+from operator import attrgetter
 from typing import Optional
 
 from heudiconv.utils import SeqInfo
 
+lgr = logging.getLogger(__name__)
+
+# The SeqInfo fields used to sort a sequence, fetched in one call
+_SEQINFO_FIELDS = attrgetter("protocol_name", "image_type", "series_id")
+
 
 def create_key(
     template: Optional[str],
@@ -15,245 +24,206 @@ def create_key(
     return (template, outtype, annotation_classes)
 
 
-def infotodict(
-    seqinfo: list[SeqInfo],
-) -> dict[tuple[str, tuple[str, ...], None], list]:
-    """Heuristic evaluator for determining which runs belong where
-
-    allowed template fields - follow python string module:
-
-    item: index within category
-    subject: participant id
-    seqitem: run number during scanning
-    subindex: sub index within group
-    session: scan index for longitudinal acq
-    """
-    t1_corrected = create_key(
+# The BIDS output keys by bucket name, built once at import since they do not
+# depend on the sequences being sorted.
+BIDS_KEYS: dict[str, tuple[str, tuple[str, ...], None]] = {
+    "t1_corrected": create_key(
         "{bids_subject_session_dir}/anat/{bids_subject_session_prefix}_ce-corrected_T1w"
-    )
-    t1_uncorrected = create_key(
+    ),
+    "t1_uncorrected": create_key(
         "{bids_subject_session_dir}/anat/{bids_subject_session_prefix}_ce-uncorrected_T1w"
-    )
-    t2_corrected = create_key(
+    ),
+    "t2_corrected": create_key(
         "{bids_subject_session_dir}/anat/{bids_subject_session_prefix}_ce-corrected_T2w"
-    )
-    t2_uncorrected = create_key(
+    ),
+    "t2_uncorrected": create_key(
         "{bids_subject_session_dir}/anat/{bids_subject_session_prefix}_ce-uncorrected_T2w"
-    )
-    flair = create_key(
+    ),
+    "flair": create_key(
         "{bids_subject_session_dir}/anat/{bids_subject_session_prefix}_FLAIR"
-    )
-    dwi_ap = create_key(
+    ),
+    "dwi_ap": create_key(
         "{bids_subject_session_dir}/dwi/{bids_subject_session_prefix}_dir-AP_dwi"
-    )
-    dwi_pa = create_key(
+    ),
+    "dwi_pa": create_key(
         "{bids_subject_session_dir}/dwi/{bids_subject_session_prefix}_dir-PA_dwi"
-    )
-    dwi_ap_sbref = create_key(
+    ),
+    "dwi_ap_sbref": create_key(
         "{bids_subject_session_dir}/dwi/{bids_subject_session_prefix}_dir-AP_sbref"
-    )
-    dwi_pa_sbref = create_key(
+    ),
+    "dwi_pa_sbref": create_key(
         "{bids_subject_session_dir}/dwi/{bids_subject_session_prefix}_dir-PA_sbref"
-    )
-    fmap_ap = create_key(
+    ),
+    "fmap_ap": create_key(
         "{bids_subject_session_dir}/fmap/{bids_subject_session_prefix}_acq-func_dir-AP_epi"
-    )
-    fmap_pa = create_key(
+    ),
+    "fmap_pa": create_key(
         "{bids_subject_session_dir}/fmap/{bids_subject_session_prefix}_acq-func_dir-PA_epi"
-    )
-    fmap_task_ap = create_key(
+    ),
+    "fmap_task_ap": create_key(
         "{bids_subject_session_dir}/fmap/{bids_subject_session_prefix}_acq-task_dir-AP_epi"
-    )
-    fmap_task_pa = create_key(
+    ),
+    "fmap_task_pa": create_key(
         "{bids_subject_session_dir}/fmap/{bids_subject_session_prefix}_acq-task_dir-PA_epi"
-    )
-    rest = create_key(
+    ),
+    "rest": create_key(
         "{bids_subject_session_dir}/func/{bids_subject_session_prefix}_task-rest_bold"
-    )
-    rest_sbref = create_key(
+    ),
+    "rest_sbref": create_key(
         "{bids_subject_session_dir}/func/{bids_subject_session_prefix}_task-rest_sbref"
-    )
+    ),
     # Functional tasks
-    bjj1 = create_key(
+    "bjj1": create_key(
         "{bids_subject_session_dir}/func/{bids_subject_session_prefix}_task-bjj1_bold"
-    )
-    bjj1_sbref = create_key(
+    ),
+    "bjj1_sbref": create_key(
         "{bids_subject_session_dir}/func/{bids_subject_session_prefix}_task-bjj1_sbref"
-    )
-    bjj2 = create_key(
+    ),
+    "bjj2": create_key(
         "{bids_subject_session_dir}/func/{bids_subject_session_prefix}_task-bjj2_bold"
-    )
-    bjj2_sbref = create_key(
+    ),
+    "bjj2_sbref": create_key(
         "{bids_subject_session_dir}/func/{bids_subject_session_prefix}_task-bjj2_sbref"
-    )
-    bjj3 = create_key(
+    ),
+    "bjj3": create_key(
         "{bids_subject_session_dir}/func/{bids_subject_session_prefix}_task-bjj3_bold"
-    )
-    bjj3_sbref = create_key(
+    ),
+    "bjj3_sbref": create_key(
         "{bids_subject_session_dir}/func/{bids_subject_session_prefix}_task-bjj3_sbref"
-    )
-    climbing1 = create_key(
+    ),
+    "climbing1": create_key(
         "{bids_subject_session_dir}/func/{bids_subject_session_prefix}_task-climbing1_bold"
-    )
-    climbing1_sbref = create_key(
+    ),
+    "climbing1_sbref": create_key(
         "{bids_subject_session_dir}/func/{bids_subject_session_prefix}_task-climbing1_sbref"
-    )
-    climbing2 = create_key(
+    ),
+    "climbing2": create_key(
         "{bids_subject_session_dir}/func/{bids_subject_session_prefix}_task-climbing2_bold"
-    )
-    climbing2_sbref = create_key(
+    ),
+    "climbing2_sbref": create_key(
         "{bids_subject_session_dir}/func/{bids_subject_session_prefix}_task-climbing2_sbref"
-    )
-    climbing3 = create_key(
+    ),
+    "climbing3": create_key(
         "{bids_subject_session_dir}/func/{bids_subject_session_prefix}_task-climbing3_bold"
-    )
-    climbing3_sbref = create_key(
+    ),
+    "climbing3_sbref": create_key(
         "{bids_subject_session_dir}/func/{bids_subject_session_prefix}_task-climbing3_sbref"
-    )
-    music1 = create_key(
+    ),
+    "music1": create_key(
         "{bids_subject_session_dir}/func/{bids_subject_session_prefix}_task-music1_bold"
-    )
-    music1_sbref = create_key(
+    ),
+    "music1_sbref": create_key(
         "{bids_subject_session_dir}/func/{bids_subject_session_prefix}_task-music1_sbref"
-    )
-    music2 = create_key(
+    ),
+    "music2": create_key(
         "{bids_subject_session_dir}/func/{bids_subject_session_prefix}_task-music2_bold"
-    )
-    music2_sbref = create_key(
+    ),
+    "music2_sbref": create_key(
         "{bids_subject_session_dir}/func/{bids_subject_session_prefix}_task-music2_sbref"
-    )
-    music3 = create_key(
+    ),
+    "music3": create_key(
         "{bids_subject_session_dir}/func/{bids_subject_session_prefix}_task-music3_bold"
-    )
-    music3_sbref = create_key(
+    ),
+    "music3_sbref": create_key(
         "{bids_subject_session_dir}/func/{bids_subject_session_prefix}_task-music3_sbref"
-    )
-    emotionalnback = create_key(
+    ),
+    "emotionalnback": create_key(
         "{bids_subject_session_dir}/func/{bids_subject_session_prefix}_task-emotionalnback_bold"
-    )
-    emotionalnback_sbref = create_key(
+    ),
+    "emotionalnback_sbref": create_key(
         "{bids_subject_session_dir}/func/{bids_subject_session_prefix}_task-emotionalnback_sbref"
-    )
+    ),
+}
+
+# Protocol name patterns in order of precedence, each with the bucket used for
+# intensity-normalized ("NORM") images and the bucket used otherwise.
+PROTOCOL_RULES: tuple[tuple[str, tuple[str, str]], ...] = (
+    ("T1w_MPRAGE", ("t1_corrected", "t1_uncorrected")),
+    ("T2w_SPC", ("t2_corrected", "t2_uncorrected")),
+    ("t2_tirm_tra_dark-fluid_FLAIR", ("flair", "flair")),
+    ("dMRI_MB4_185dirs_d15D45_AP", ("dwi_ap", "dwi_ap")),
+    ("ep2d_d15.5D60_MB3_AP", ("dwi_ap", "dwi_ap")),
+    ("dMRI_MB4_6dirs_d15D45_PA", ("dwi_pa", "dwi_pa")),
+    ("ep2d_d15.5D60_MB3_PA", ("dwi_pa", "dwi_pa")),
+    ("dMRI_MB4_185dirs_d15D45_AP_SBRef", ("dwi_ap_sbref", "dwi_ap_sbref")),
+    ("dMRI_MB4_6dirs_d15D45_PA_SBRef", ("dwi_pa_sbref", "dwi_pa_sbref")),
+    ("SpinEchoFieldMap_AP", ("fmap_ap", "fmap_ap")),
+    ("SE_rsfMRI_FieldMap_AP", ("fmap_ap", "fmap_ap")),
+    ("SpinEchoFieldMap_PA", ("fmap_pa", "fmap_pa")),
+    ("SE_rsfMRI_FieldMap_PA", ("fmap_pa", "fmap_pa")),
+    ("rsfMRI_AP", ("rest", "rest")),
+    ("rsfMRI_AP_SBRef", ("rest_sbref", "rest_sbref")),
+    ("tfMRI_BJJ1_AP", ("bjj1", "bjj1")),
+    ("tfMRI_BJJ1_AP_SBRef", ("bjj1_sbref", "bjj1_sbref")),
+    ("tfMRI_BJJ2_AP", ("bjj2", "bjj2")),
+    ("tfMRI_BJJ2_AP_SBRef", ("bjj2_sbref", "bjj2_sbref")),
+    ("tfMRI_BJJ3_AP", ("bjj3", "bjj3")),
+    ("tfMRI_BJJ3_AP_SBRef", ("bjj3_sbref", "bjj3_sbref")),
+    ("tfMRI_Climbing1_AP", ("climbing1", "climbing1")),
+    ("tfMRI_Climbing1_AP_SBRef", ("climbing1_sbref", "climbing1_sbref")),
+    ("tfMRI_Climbing2_AP", ("climbing2", "climbing2")),
+    ("tfMRI_Climbing2_AP_SBRef", ("climbing2_sbref", "climbing2_sbref")),
+    ("tfMRI_Climbing3_AP", ("climbing3", "climbing3")),
+    ("tfMRI_Climbing3_AP_SBRef", ("climbing3_sbref", "climbing3_sbref")),
+    ("tfMRI_Music1_AP", ("music1", "music1")),
+    ("tfMRI_Music1_AP_SBRef", ("music1_sbref", "music1_sbref")),
+    ("tfMRI_Music2_AP", ("music2", "music2")),
+    ("tfMRI_Music2_AP_SBRef", ("music2_sbref", "music2_sbref")),
+    ("tfMRI_Music3_AP", ("music3", "music3")),
+    ("tfMRI_Music3_AP_SBRef", ("music3_sbref", "music3_sbref")),
+    ("tfMRI_EmotionalNBack_AP", ("emotionalnback", "emotionalnback")),
+    (
+        "tfMRI_EmotionalNBack_AP_SBRef",
+        ("emotionalnback_sbref", "emotionalnback_sbref"),
+    ),
+)
+_PROTOCOL_PRECEDENCE = {pattern: i for i, (pattern, _) in enumerate(PROTOCOL_RULES)}
+# A lookahead at every position of the protocol name, where the alternation
+# yields the highest-precedence pattern starting at that position.
+_PROTOCOL_MATCHER = re.compile(
+    "(?=(" + "|".join(re.escape(pattern) for pattern, _ in PROTOCOL_RULES) + "))"
+)
 
+
+@lru_cache(maxsize=None)
+def match_protocol(protocol_name: str) -> Optional[tuple[str, tuple[str, str]]]:
+    """Return the highest-precedence rule whose pattern occurs in the protocol
+    name, or None if no pattern does. Equivalent to checking each pattern in
+    turn, but scans the name once. Results are cached by protocol name, since
+    a session repeats the same few protocols across runs and SBRefs."""
+    precedences = [
+        _PROTOCOL_PRECEDENCE[match.group(1)]
+        for match in _PROTOCOL_MATCHER.finditer(protocol_name)
+    ]
+    if not precedences:
+        return None
+    return PROTOCOL_RULES[min(precedences)]
+
+
+def infotodict(
+    seqinfo: list[SeqInfo],
+) -> dict[tuple[str, tuple[str, ...], None], list]:
+    """Heuristic evaluator for determining which runs belong where
+
+    allowed template fields - follow python string module:
+
+    item: index within category
+    subject: participant id
+    seqitem: run number during scanning
+    subindex: sub index within group
+    session: scan index for longitudinal acq
+    """
     info: dict[tuple[str, tuple[str, ...], None], list] = {
-        t1_corrected: [],
-        t1_uncorrected: [],
-        t2_corrected: [],
-        t2_uncorrected: [],
-        flair: [],
-        dwi_ap: [],
-        dwi_pa: [],
-        dwi_ap_sbref: [],
-        dwi_pa_sbref: [],
-        fmap_ap: [],
-        fmap_pa: [],
-        fmap_task_ap: [],
-        fmap_task_pa: [],
-        rest: [],
-        rest_sbref: [],
-        bjj1: [],
-        bjj1_sbref: [],
-        bjj2: [],
-        bjj2_sbref: [],
-        bjj3: [],
-        bjj3_sbref: [],
-        climbing1: [],
-        climbing1_sbref: [],
-        climbing2: [],
-        climbing2_sbref: [],
-        climbing3: [],
-        climbing3_sbref: [],
-        music1: [],
-        music1_sbref: [],
-        music2: [],
-        music2_sbref: [],
-        music3: [],
-        music3_sbref: [],
-        emotionalnback: [],
-        emotionalnback_sbref: [],
+        key: [] for key in BIDS_KEYS.values()
     }
 
-    for s in seqinfo:
-        if "T1w_MPRAGE" in s.protocol_name:
-            print(s.image_type)
-            if "NORM" in s.image_type:
-                info[t1_corrected].append(s.series_id)
-            else:
-                info[t1_uncorrected].append(s.series_id)
-        elif "T2w_SPC" in s.protocol_name:
-            if "NORM" in s.image_type:
-                info[t2_corrected].append(s.series_id)
-            else:
-                info[t2_uncorrected].append(s.series_id)
-        elif "t2_tirm_tra_dark-fluid_FLAIR" in s.protocol_name:
-            info[flair].append(s.series_id)
-        elif (
-            "dMRI_MB4_185dirs_d15D45_AP" in s.protocol_name
-            or "ep2d_d15.5D60_MB3_AP" in s.protocol_name
-        ):
-            info[dwi_ap].append(s.series_id)
-        elif (
-            "dMRI_MB4_6dirs_d15D45_PA" in s.protocol_name
-            or "ep2d_d15.5D60_MB3_PA" in s.protocol_name
-        ):
-            info[dwi_pa].append(s.series_id)
-        elif "dMRI_MB4_185dirs_d15D45_AP_SBRef" in s.protocol_name:
-            info[dwi_ap_sbref].append(s.series_id)
-        elif "dMRI_MB4_6dirs_d15D45_PA_SBRef" in s.protocol_name:
-            info[dwi_pa_sbref].append(s.series_id)
-        elif (
-            "SpinEchoFieldMap_AP" in s.protocol_name
-            or "SE_rsfMRI_FieldMap_AP" in s.protocol_name
-        ):
-            info[fmap_ap].append(s.series_id)
-        elif (
-            "SpinEchoFieldMap_PA" in s.protocol_name
-            or "SE_rsfMRI_FieldMap_PA" in s.protocol_name
-        ):
-            info[fmap_pa].append(s.series_id)
-        elif "rsfMRI_AP" in s.protocol_name:
-            info[rest].append(s.series_id)
-        elif "rsfMRI_AP_SBRef" in s.protocol_name:
-            info[rest_sbref].append(s.series_id)
-        elif "tfMRI_BJJ1_AP" in s.protocol_name:
-            info[bjj1].append(s.series_id)
-        elif "tfMRI_BJJ1_AP_SBRef" in s.protocol_name:
-            info[bjj1_sbref].append(s.series_id)
-        elif "tfMRI_BJJ2_AP" in s.protocol_name:
-            info[bjj2].append(s.series_id)
-        elif "tfMRI_BJJ2_AP_SBRef" in s.protocol_name:
-            info[bjj2_sbref].append(s.series_id)
-        elif "tfMRI_BJJ3_AP" in s.protocol_name:
-            info[bjj3].append(s.series_id)
-        elif "tfMRI_BJJ3_AP_SBRef" in s.protocol_name:
-            info[bjj3_sbref].append(s.series_id)
-        elif "tfMRI_Climbing1_AP" in s.protocol_name:
-            info[climbing1].append(s.series_id)
-        elif "tfMRI_Climbing1_AP_SBRef" in s.protocol_name:
-            info[climbing1_sbref].append(s.series_id)
-        elif "tfMRI_Climbing2_AP" in s.protocol_name:
-            info[climbing2].append(s.series_id)
-        elif "tfMRI_Climbing2_AP_SBRef" in s.protocol_name:
-            info[climbing2_sbref].append(s.series_id)
-        elif "tfMRI_Climbing3_AP" in s.protocol_name:
-            info[climbing3].append(s.series_id)
-        elif "tfMRI_Climbing3_AP_SBRef" in s.protocol_name:
-            info[climbing3_sbref].append(s.series_id)
-        elif "tfMRI_Music1_AP" in s.protocol_name:
-            info[music1].append(s.series_id)
-        elif "tfMRI_Music1_AP_SBRef" in s.protocol_name:
-            info[music1_sbref].append(s.series_id)
-        elif "tfMRI_Music2_AP" in s.protocol_name:
-            info[music2].append(s.series_id)
-        elif "tfMRI_Music2_AP_SBRef" in s.protocol_name:
-            info[music2_sbref].append(s.series_id)
-        elif "tfMRI_Music3_AP" in s.protocol_name:
-            info[music3].append(s.series_id)
-        elif "tfMRI_Music3_AP_SBRef" in s.protocol_name:
-            info[music3_sbref].append(s.series_id)
-        elif "tfMRI_EmotionalNBack_AP" in s.protocol_name:
-            info[emotionalnback].append(s.series_id)
-        elif "tfMRI_EmotionalNBack_AP_SBRef" in s.protocol_name:
-            info[emotionalnback_sbref].append(s.series_id)
+    for protocol_name, image_type, series_id in map(_SEQINFO_FIELDS, seqinfo):
+        rule = match_protocol(protocol_name)
+        if rule is None:
+            continue
+        pattern, (normalized, other) = rule
+        lgr.debug("%s matched %s, image type %s", protocol_name, pattern, image_type)
+        bucket = normalized if "NORM" in image_type else other
+        info[BIDS_KEYS[bucket]].append(series_id)
 
     return info
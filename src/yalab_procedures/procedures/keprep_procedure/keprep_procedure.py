@@ -1,23 +1,17 @@
-import os
-import os.path as op
-from pathlib import Path
-from typing import Any
+from typing import TYPE_CHECKING
 
-import keprep
-from keprep import config, data
-from keprep.config import init_spaces
-from keprep.data.quality_assurance.reports import build_boilerplate, run_reports
-from keprep.workflows.base.workflow import init_keprep_wf
-from nipype.interfaces.base import Directory, File, isdefined, traits
-from niworkflows.engine.workflows import LiterateWorkflow as Workflow
+from nipype.interfaces.base import Directory, File, traits
 
+from yalab_procedures.procedures.base.nipreps_procedure import NiPrepsProcedure
 from yalab_procedures.procedures.base.procedure import (
-    Procedure,
     ProcedureInputSpec,
     ProcedureOutputSpec,
 )
 from yalab_procedures.procedures.keprep_procedure.templates.inputs import INPUTS_MAPPING
 
+if TYPE_CHECKING:
+    from niworkflows.engine.workflows import LiterateWorkflow as Workflow
+
 
 class KePrepInputSpec(ProcedureInputSpec):
     """
@@ -26,7 +20,7 @@ class KePrepInputSpec(ProcedureInputSpec):
 
     # Execution configuration
     input_directory = Directory(
-        exists=True,
+        exists=False,
         mandatory=True,
         desc="Input directory containing raw data in BIDS format",
     )
@@ -51,7 +45,7 @@ class KePrepInputSpec(ProcedureInputSpec):
         desc="BIDS filter file",
     )
     reset_database = traits.Bool(
-        True,
+        False,
         usedefault=True,
         desc="Whether to reset the database",
     )
@@ -133,8 +127,6 @@ class KePrepInputSpec(ProcedureInputSpec):
         desc="Crashfile format",
     )
     nprocs = traits.Int(
-        os.cpu_count(),
-        usedefault=True,
         desc="Number of processes (compute tasks) that can be run in parallel (multiprocessing only).",
     )
     omp_nthreads = traits.Int(
@@ -165,140 +157,46 @@ class KePrepOutputSpec(ProcedureOutputSpec):
     output_directory = Directory(desc="KePrep output directory")
 
 
-class KePrepProcedure(Procedure):
+class KePrepProcedure(NiPrepsProcedure):
     """
     Procedure for running Smriprep
     """
 
     input_spec = KePrepInputSpec
     output_spec = KePrepOutputSpec
-    _version = keprep.__version__
-
-    def __init__(self, **inputs: Any):
-        super().__init__(**inputs)
-
-    def _setup_config_toml(self):
-        """
-        Set up the configuration file
-        """
-        inputs_dict = self.inputs.get()
-        configuration_dict = {}
-        for key, value in inputs_dict.items():
-            if key in INPUTS_MAPPING:
-                target_key = INPUTS_MAPPING.get(key)
-                if not isdefined(value):
-                    default_value = self._get_default_value(key)
-                    if isdefined(default_value):
-                        configuration_dict[target_key] = default_value
-                    else:
-                        raise ValueError(f"Value for {key} not provided.")
-                else:
-                    configuration_dict[target_key] = value
-            else:
-                if isdefined(value):
-                    configuration_dict[key] = value
-        return configuration_dict
+    _package = "keprep"
+    _inputs_mapping = INPUTS_MAPPING
+    _database_dir_key = "bids_database_dir"
+    _database_dir_name = "bids_db"
 
-    def _get_default_value(self, key: str) -> Any:
-        """
-        Get the default value of an input
-        """
-        value = getattr(self.inputs, key)
-        return value if isdefined(value) else self.inputs.traits().get(key).default
+    def _run_workflow(self, configuration_dict: dict) -> "Workflow":
+        from keprep import config
+        from keprep.config import init_spaces
+        from keprep.workflows.base.workflow import init_keprep_wf
 
-    def run_procedure(self, **kwargs):
-        """
-        Run the SmriprepProcedure
-
-        Raises
-        ------
-        CalledProcessError
-            If the command fails to run. The error message will be logged.
-        """
-
-        self.logger.info("Running KePrepProcedure")
-        self.logger.debug(f"Input attributes: {kwargs}")
-
-        # Locate the FreeSurfer license file
-        self._locate_fs_license_file()
-        # Prepare inputs
-        configuration_dict = self._setup_config_toml()
         config.from_dict(configuration_dict)
         init_spaces()
 
         # Run the workflow
         workflow = init_keprep_wf()
         if self.inputs.write_graph:
-            workflow.write_graph(graph2use="colored", format="png", simple_form=True)
-        workflow.run()
-        self._generate_reports(workflow=workflow, configuration_dict=configuration_dict)
+            workflow.write_graph(graph2use="colored", format="svg", simple_form=True)
+        self._execute_workflow(workflow, config)
+        return workflow
+
+    def _generate_reports(self, workflow: "Workflow", configuration_dict: dict):
+        from keprep import config, data
+        from keprep.data.quality_assurance.reports import (
+            build_boilerplate,
+            run_reports,
+        )
 
-    def _generate_reports(self, workflow: Workflow, configuration_dict: dict):
         # Generate reports
         build_boilerplate(config_file=configuration_dict, workflow=workflow)
         bootstrap_file = data.load("quality_assurance/templates/reports-spec.yml")
-        run_uuid = config.execution.run_uuid
-        for participant_label in self.inputs.participant_label:
-            err = run_reports(
-                config.execution.keprep_dir,
-                participant_label,
-                run_uuid,
-                bootstrap_file=bootstrap_file,
-                out_filename="report.html",
-                reportlets_dir=config.execution.keprep_dir,
-                errorname=f"report-{run_uuid}-{participant_label}.err",
-                subject=participant_label,
-            )
-            if err:
-                self.logger.warn(
-                    f"Failed to generate report for subject {participant_label}"
-                )
-
-    # function to avoid rerunning if force is not set
-    def _check_output_directory(self):
-        """
-        Check if the output directory already exists
-        """
-        if not self.inputs.force:
-            self.logger.info(
-                f"Attempting to locate outputs from previous run in {self.inputs.output_directory}"
-            )
-            result = self._list_outputs()
-            if all(Path(value).exists() for value in result.values()):
-                self.logger.info(
-                    f"Outputs already exist in {self.inputs.output_directory}. If you want to run the procedure again, set force=True."
-                )
-                return
-
-    def _locate_fs_license_file(self):
-        """
-        Locate the FreeSurfer license file
-        """
-        if not isdefined(self.inputs.fs_license_file):
-            fs_home = os.getenv("FREESURFER_HOME")
-            if fs_home is None:
-                raise ValueError(
-                    "FREESURFER_HOME environment variable is not set and fs_license_file is not provided."
-                )
-            fs_license_file = Path(fs_home) / "license.txt"
-            if not fs_license_file.exists():
-                raise ValueError(
-                    f"FreeSurfer license file not found at {fs_license_file}"
-                )
-            self.inputs.fs_license_file = str(Path(fs_home) / "license.txt")
-
-    def _list_outputs(self):
-        outputs = self.output_spec().get()
-        outputs["output_directory"] = op.abspath(self.inputs.output_directory)
-        return outputs
-
-    @property
-    def sessions(self):
-        """
-        Get the sessions
-        """
-        return [
-            session.name.split("-")[-1]
-            for session in Path(self.inputs.input_directory).glob("ses-*")
-            if session.is_dir()
-        ]
+        self._run_reports(
+            run_reports,
+            config.execution.keprep_dir,
+            config.execution.run_uuid,
+            bootstrap_file,
+        )
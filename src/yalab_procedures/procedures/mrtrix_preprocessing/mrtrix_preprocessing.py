@@ -1,7 +1,7 @@
 import os
 from pathlib import Path
+from typing import Optional, Tuple
 
-import git
 from nipype import logging as nipype_logging
 from nipype.interfaces.base import CommandLine, Directory, isdefined, traits
 
@@ -10,10 +10,6 @@ from yalab_procedures.procedures.base.procedure import (
     ProcedureInputSpec,
     ProcedureOutputSpec,
 )
-from yalab_procedures.procedures.mrtrix_preprocessing.workflows.mrtrix_preprocessing_wf import (
-    init_comis_cortical_wf,
-    init_mrtrix_preprocessing_wf,
-)
 
 COMIS_CORTICAL_GITHUB = "https://github.com/RonnieKrup/ComisCorticalCode.git"
 
@@ -80,6 +76,8 @@ class MrtrixPreprocessingProcedure(Procedure, CommandLine):
 
     def __init__(self, **inputs: dict):
         super().__init__(**inputs)
+        # Input directory the IDs were inferred from, and the inferred IDs
+        self._inferred_ids: Optional[Tuple[str, str, str]] = None
 
     def set_missing_inputs(self):
         """
@@ -100,6 +98,10 @@ class MrtrixPreprocessingProcedure(Procedure, CommandLine):
         """
         Run the MRtrix preprocessing procedure
         """
+        from yalab_procedures.procedures.mrtrix_preprocessing.workflows.mrtrix_preprocessing_wf import (  # noqa: E501
+            init_comis_cortical_wf,
+        )
+
         self.logger.info("Starting MRtrix preprocessing procedure...")
         self.logger.info("Validating Comis cortical executable.")
         self.validate_comis_cortical_exec()
@@ -120,9 +122,9 @@ class MrtrixPreprocessingProcedure(Procedure, CommandLine):
         src_path = Path(self.inputs.output_directory) / self.inputs.subject_id
         for root, dirs, files in os.walk(src_path):
             for directory in dirs:
-                os.chmod(Path(root) / directory, 0o755)  # Directories: rwxr-xr-x
+                os.chmod(os.path.join(root, directory), 0o755)  # Directories: rwxr-xr-x
             for file in files:
-                os.chmod(Path(root) / file, 0o644)  # Files: rw-r--r--
+                os.chmod(os.path.join(root, file), 0o644)  # Files: rw-r--r--
         self.logger.info(f"Permissions changed for '{src_path}'")
         if isdefined(self.inputs.final_output_directory):
             dest = Path(self.inputs.final_output_directory) / self.inputs.subject_id
@@ -141,6 +143,10 @@ class MrtrixPreprocessingProcedure(Procedure, CommandLine):
         wf : pe.Workflow
             The MRtrix preprocessing workflow
         """
+        from yalab_procedures.procedures.mrtrix_preprocessing.workflows.mrtrix_preprocessing_wf import (  # noqa: E501
+            init_mrtrix_preprocessing_wf,
+        )
+
         wf = init_mrtrix_preprocessing_wf(self._gen_wf_name())
         if isdefined(self.inputs.work_directory):
             wf.base_dir = self.inputs.work_directory
@@ -184,6 +190,8 @@ class MrtrixPreprocessingProcedure(Procedure, CommandLine):
         """
         Clone the Comis cortical repository
         """
+        import git
+
         comis_cortical_repo = Path(self.inputs.work_directory) / "ComisCorticalCode"
         nipype_logging.getLogger("nipype.workflow").info(
             f"Cloning Comis cortical repository to {comis_cortical_repo}"
@@ -199,7 +207,23 @@ class MrtrixPreprocessingProcedure(Procedure, CommandLine):
         return f"mrtrix_preprocessing_sub-{self.inputs.subject_id}_ses-{self.inputs.session_id}"
 
     def infer_session_id(self):
-        return Path(self.inputs.input_directory).parts[-1].split("-")[-1]
+        return self._infer_ids()[1]
 
     def infer_subject_id(self):
-        return Path(self.inputs.input_directory).parts[-2].split("-")[-1]
+        return self._infer_ids()[0]
+
+    def _infer_ids(self):
+        """
+        Infer the subject and session IDs from a single split of the input directory
+        """
+        input_directory = self.inputs.input_directory
+        cached = self._inferred_ids
+        if cached is None or cached[0] != input_directory:
+            *_, subject_part, session_part = Path(input_directory).parts
+            cached = (
+                input_directory,
+                subject_part.rpartition("-")[2],
+                session_part.rpartition("-")[2],
+            )
+            self._inferred_ids = cached
+        return cached[1:]
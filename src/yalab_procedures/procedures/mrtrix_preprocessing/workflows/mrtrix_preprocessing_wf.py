@@ -24,16 +24,20 @@ def get_files_from_config(config_file: str, keys: list = ["datain", "index"]):
     files : list
         The files extracted from the configuration file
     """
-    import json
     import logging
 
+    try:
+        from orjson import loads
+    except ImportError:  # pragma: no cover
+        from json import loads
+
     logger = logging.getLogger(__name__)
     logger.info(f"Reading configuration file: {config_file}")
 
     result = {}
 
-    with open(config_file, "r") as f:
-        config = json.load(f)
+    with open(config_file, "rb") as f:
+        config = loads(f.read())
     config = {key.lower(): value for key, value in config.items()}
     for key in keys:
         value = config.get(key, None)
@@ -73,6 +73,7 @@ def copy_file_to_output_directory(in_file: str, output_directory: str, out_name:
         The output file
     """
     import logging
+    import sys
     from pathlib import Path
     from shutil import copyfile
 
@@ -85,34 +86,59 @@ def copy_file_to_output_directory(in_file: str, output_directory: str, out_name:
     output_directory_path = Path(output_directory)
     out_file = output_directory_path / out_name
 
+    # Clone the file where the filesystem supports copy-on-write (btrfs, xfs),
+    # so raw data shares blocks with the source until either is modified.
+    # A hard link is not used, since later permission changes would leak back
+    # into the BIDS dataset.
+    if sys.platform.startswith("linux"):
+        import fcntl
+
+        # Linux FICLONE ioctl, exposed by the fcntl module from Python 3.12
+        FICLONE = getattr(fcntl, "FICLONE", 0x40049409)
+        try:
+            with open(in_file_path, "rb") as src, open(out_file, "wb") as dst:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            return out_file
+        except OSError:
+            pass
     copyfile(in_file_path, out_file)
 
     return out_file
 
 
-def rename_config_file(in_file: str, subject_id: str, session_id: str):
+def copy_config_file(
+    in_file: str, output_directory: str, subject_id: str, session_id: str
+):
     """
-    Rename the config file to include the subject and session ID.
+    Copy the config file to the output directory, named after the subject and
+    session ID.
 
     Parameters
     ----------
     in_file : str
         The input file
+    output_directory : str
+        The output directory
     subject_id : str
         The subject ID
     session_id : str
         The session ID
+
+    Returns
+    -------
+    out_file : str
+        The output file
     """
     import logging
     from pathlib import Path
+    from shutil import copyfile
 
     logger = logging.getLogger(__name__)
 
-    in_file_path = Path(in_file)
-    out_file = in_file_path.parent / f"{subject_id}_{session_id}.json"
-    in_file_path.rename(out_file)
+    out_file = Path(output_directory) / f"{subject_id}_{session_id}.json"
+    copyfile(in_file, out_file)
     logger.info(
-        f"Renaming config file: {in_file} to {out_file} with subject ID: {subject_id} and session ID: {session_id}"
+        f"Copying config file: {in_file} to {out_file} with subject ID: {subject_id} and session ID: {session_id}"
     )
 
     return out_file
@@ -280,45 +306,33 @@ def init_prepare_inputs_wf():
         run_without_submitting=True,
     )
 
-    # Create a node to copy the config file to the configureation directory
+    # Create a node to copy the config file to the configuration directory
     copy_config_node = pe.Node(
         Function(
-            function=copy_file_to_output_directory,
-            input_names=["in_file", "output_directory", "out_name"],
+            function=copy_config_file,
+            input_names=["in_file", "output_directory", "subject_id", "session_id"],
             output_names=["out_file"],
         ),
         name="copy_config_node",
         run_without_submitting=True,
     )
-    copy_config_node.inputs.out_name = "config.json"
     prepare_inputs_wf.connect(
         [
-            (input_node, copy_config_node, [("config_file", "in_file")]),
             (
-                setup_output_directory_node,
+                input_node,
                 copy_config_node,
-                [("config_files_output_directory", "output_directory")],
+                [
+                    ("config_file", "in_file"),
+                    ("subject_id", "subject_id"),
+                    ("session_id", "session_id"),
+                ],
             ),
-        ]
-    )
-    rename_config_node = pe.Node(
-        Function(
-            function=rename_config_file,
-            input_names=["in_file", "subject_id", "session_id"],
-            output_names=["out_file"],
-        ),
-        name="rename_config_node",
-        run_without_submitting=True,
-    )
-    prepare_inputs_wf.connect(
-        [
             (
-                input_node,
-                rename_config_node,
-                [("subject_id", "subject_id"), ("session_id", "session_id")],
+                setup_output_directory_node,
+                copy_config_node,
+                [("config_files_output_directory", "output_directory")],
             ),
-            (copy_config_node, rename_config_node, [("out_file", "in_file")]),
-            (rename_config_node, output_node, [("out_file", "config_file")]),
+            (copy_config_node, output_node, [("out_file", "config_file")]),
         ]
     )
 
@@ -1,7 +1,8 @@
 # src/yalab_procedures/procedures/dicom_to_bids.py
 
+import shlex
 from pathlib import Path
-from subprocess import CalledProcessError, run
+from subprocess import CalledProcessError
 
 from nipype.interfaces.base import (
     CommandLine,
@@ -170,20 +171,12 @@ class NeuroflowProcedure(Procedure, CommandLine):
         """
 
         self.logger.info("Running NeuroflowProcedure")
-        self.logger.debug(f"Input attributes: {kwargs}")
-
-        # Run the heudiconv command
-        command = self.cmdline
-        result = run(
-            command,
-            shell=True,
-            check=False,
-            capture_output=True,
-            text=True,
-        )
-        self.logger.info(result.stdout)
+        self.logger.debug("Input attributes: %s", kwargs)
+
+        # Run the neuroflow command, streaming its output to the log
+        command = shlex.split(self.cmdline)
+        result = self._run_command(command)
         if result.stderr:
-            self.logger.error(result.stderr)
             raise CalledProcessError(
                 result.returncode, command, output=result.stdout, stderr=result.stderr
             )
@@ -220,6 +213,6 @@ class NeuroflowProcedure(Procedure, CommandLine):
         dict
             The outputs of the procedure
         """
-        outputs = self._outputs().get()
+        outputs = dict(self._empty_outputs())
         outputs["output_directory"] = str(self.inputs.output_directory)
         return outputs
@@ -156,13 +156,6 @@ class SmriprepProcedure(Procedure, CommandLine):
             all_args += [arg]
         return all_args
 
-    def _get_default_value(self, key: str) -> Any:
-        """
-        Get the default value of an input
-        """
-        value = getattr(self.inputs, key)
-        return value if isdefined(value) else self.inputs.traits().get(key).default
-
     def _add_mounts_to_command(
         self,
         mounts: dict = {
@@ -178,9 +171,7 @@ class SmriprepProcedure(Procedure, CommandLine):
         for key, argstr in mounts.items():
             value = getattr(self.inputs, key)
             if isdefined(value):
-                mounted_destination = (
-                    self.inputs.traits().get(key).argstr.split(":")[-1]
-                )
+                mounted_destination = self.inputs.trait(key).argstr.split(":")[-1]
                 args += [f"{argstr} {mounted_destination}"]
         return args
 
@@ -195,14 +186,14 @@ class SmriprepProcedure(Procedure, CommandLine):
         """
 
         self.logger.info("Running SmriprepProcedure")
-        self.logger.debug(f"Input attributes: {kwargs}")
+        self.logger.debug("Input attributes: %s", kwargs)
 
         if not self.inputs.force:
             self.logger.info(
                 f"Attempting to locate outputs from previous run in {self.inputs.output_directory}"
             )
             result = self._list_outputs()
-            if all(Path(value).exists() for value in result.values()):
+            if all(os.path.exists(value) for value in result.values()):
                 self.logger.info(
                     f"Outputs already exist in {self.inputs.output_directory}. If you want to run the procedure again, set force=True."
                 )
@@ -299,37 +290,26 @@ class SmriprepProcedure(Procedure, CommandLine):
         """
         List the outputs of the SmriprepProcedure
         """
-        outputs_level = "session" if len(self.sessions) == 1 else "subject"
-        output_directory = Path(self.inputs.output_directory)
-        outputs = self._outputs().get()
-        outputs["output_directory"] = str(output_directory)
+        # Glob the sessions once rather than on every output
+        sessions = self.sessions
+        outputs_level = "session" if len(sessions) == 1 else "subject"
+        output_directory = str(Path(self.inputs.output_directory))
+        # Read the inputs once, outside the loop
+        format_kwargs = {"subject": self.inputs.participant_label}
+        if outputs_level == "session":
+            format_kwargs["session"] = sessions[0]
+        outputs = dict(self._empty_outputs())
+        outputs["output_directory"] = output_directory
         for (
             output_source,
             output_formats,
         ) in smriprep_outputs.items():
-            search_destination = output_directory / output_source
+            search_destination = f"{output_directory}/{output_source}"
             for output, desc in output_formats.items():
                 key = output if output_source != "freesurfer" else f"fs_{output}"
                 template = desc.get(outputs_level) if isinstance(desc, dict) else desc
-                if outputs_level == "session":
-                    value = template.format(
-                        subject=self.inputs.participant_label,
-                        session=self.sessions[0],
-                    )
-                else:
-                    value = template.format(subject=self.inputs.participant_label)
-                outputs[key] = str(search_destination / value)
+                value = template.format(**format_kwargs)
+                outputs[key] = f"{search_destination}/{value}"
         if hasattr(self, "log_file_path"):
             outputs["log_file"] = str(self.log_file_path)
         return outputs
-
-    @property
-    def sessions(self):
-        """
-        Get the sessions
-        """
-        return [
-            session.name.split("-")[-1]
-            for session in Path(self.inputs.input_directory).glob("ses-*")
-            if session.is_dir()
-        ]
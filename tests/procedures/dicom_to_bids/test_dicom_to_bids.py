@@ -1,9 +1,10 @@
 # tests/procedures/procedure/test_dicom_to_bids.py
 
+import sys
 import tempfile
 from datetime import datetime
 from pathlib import Path
-from subprocess import CalledProcessError
+from subprocess import CalledProcessError, CompletedProcess
 from unittest.mock import patch
 
 import pytest
@@ -106,17 +107,46 @@ def test_infer_session_id(dicom_to_bids_procedure_no_session):
     assert dicom_to_bids_procedure_no_session.inputs.session_id == true_session_id
 
 
-@patch("subprocess.run")
-def test_run_procedure(mock_run, dicom_to_bids_procedure):
-    mock_run.return_value.returncode = 0
-    with pytest.raises(CalledProcessError):
-        dicom_to_bids_procedure.run()
+def test_build_commandline_expands_dicom_files(dicom_to_bids_procedure):
+    input_dir = Path(dicom_to_bids_procedure.inputs.input_directory)
+    expected_files = []
+    for series in ["series_2", "series_1"]:
+        (input_dir / series).mkdir()
+        dicom_file = input_dir / series / "image 1.dcm"
+        dicom_file.touch()
+        expected_files.append(str(dicom_file))
+    (input_dir / "series_1" / "notes.txt").touch()
+
+    command = dicom_to_bids_procedure.build_commandline()
+    assert command[0] == "heudiconv"
+    first_file = command.index("--files") + 1
+    assert command[first_file:] == sorted(expected_files)
+
 
+def _completed(returncode: int, stderr: str = ""):
+    def run_command(self, command):
+        return CompletedProcess(command, returncode, "", stderr)
 
-@patch("subprocess.run")
-def test_logging_setup(mock_run, dicom_to_bids_procedure):
-    mock_run.return_value.returncode = 0
-    with pytest.raises(CalledProcessError):
+    return run_command
+
+
+def test_run_procedure(dicom_to_bids_procedure):
+    with patch.object(
+        DicomToBidsProcedure, "_run_command", autospec=True, side_effect=_completed(0)
+    ) as mock_run_command:
+        dicom_to_bids_procedure.run()
+    mock_run_command.assert_called_once()
+    _, command = mock_run_command.call_args.args
+    assert command == dicom_to_bids_procedure.build_commandline()
+    assert command[0] == "heudiconv"
+    assert command[command.index("-s") + 1] == "test_subject"
+    assert command[command.index("-ss") + 1] == "01"
+
+
+def test_logging_setup(dicom_to_bids_procedure):
+    with patch.object(
+        DicomToBidsProcedure, "_run_command", autospec=True, side_effect=_completed(0)
+    ):
         dicom_to_bids_procedure.run()
     log_files = list(
         Path(dicom_to_bids_procedure.inputs.logging_directory).glob("*.log")
@@ -127,20 +157,65 @@ def test_logging_setup(mock_run, dicom_to_bids_procedure):
         assert "Running DicomToBidsProcedure" in log_content
 
 
-@patch("subprocess.run")
-def test_logger_contains_error(mock_run, dicom_to_bids_procedure):
-    mock_run.return_value.returncode = 1
-    mock_run._cmd = "wrong_command"
-    with pytest.raises(CalledProcessError):
-        dicom_to_bids_procedure.run()
+def test_logger_contains_error(dicom_to_bids_procedure):
+    with patch.object(
+        DicomToBidsProcedure,
+        "_run_command",
+        autospec=True,
+        side_effect=_completed(1, "heudiconv: error\n"),
+    ):
+        with pytest.raises(CalledProcessError):
+            dicom_to_bids_procedure.run()
     log_files = list(
         Path(dicom_to_bids_procedure.inputs.logging_directory).glob("*.log")
     )
     assert len(log_files) == 1
 
 
+def test_missing_executable_raises_called_process_error(
+    dicom_to_bids_procedure, temp_dir
+):
+    command = [str(temp_dir / "missing" / "heudiconv"), "--bids"]
+    with patch.object(DicomToBidsProcedure, "build_commandline", return_value=command):
+        with pytest.raises(CalledProcessError) as error:
+            dicom_to_bids_procedure.run()
+    assert error.value.returncode == 127
+    assert error.value.cmd == command
+    (log_file,) = Path(dicom_to_bids_procedure.inputs.logging_directory).glob("*.log")
+    assert f"ERROR - Failed to run {command[0]}" in log_file.read_text()
+
+
 def test_list_outputs(dicom_to_bids_procedure):
     outputs = dicom_to_bids_procedure._list_outputs()
     assert outputs["bids_directory"] == str(
         dicom_to_bids_procedure.inputs.output_directory
     )
+
+
+def test_build_commandline_does_not_set_up_logging(dicom_to_bids_procedure):
+    log_dir = Path(dicom_to_bids_procedure.inputs.logging_directory)
+    dicom_to_bids_procedure.build_commandline()
+    assert dicom_to_bids_procedure._logger is None
+    assert not list(log_dir.glob("*.log"))
+
+
+def test_failing_command_logs_stderr(dicom_to_bids_procedure):
+    command = [
+        sys.executable,
+        "-c",
+        "import sys; print('converting'); print('first problem', file=sys.stderr); "
+        "print('second problem', file=sys.stderr); sys.exit(1)",
+    ]
+    with patch.object(DicomToBidsProcedure, "build_commandline", return_value=command):
+        with pytest.raises(CalledProcessError) as error:
+            dicom_to_bids_procedure.run()
+    assert error.value.returncode == 1
+    assert error.value.output == "converting\n"
+    assert error.value.stderr == "first problem\nsecond problem\n"
+    (log_file,) = Path(dicom_to_bids_procedure.inputs.logging_directory).glob("*.log")
+    log_content = log_file.read_text()
+    assert "first problem" in log_content
+    assert "second problem" in log_content
+    # The failure itself is reported once
+    assert log_content.count("ERROR") == 1
+    assert f"ERROR - {sys.executable} exited with return code 1" in log_content
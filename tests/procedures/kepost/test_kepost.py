@@ -0,0 +1,48 @@
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from yalab_procedures.procedures.kepost_procedure.kepost_procedure import (
+    KePostProcedure,
+)
+
+
+@pytest.fixture
+def temp_dir():
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as tmpdirname:
+        yield Path(tmpdirname)
+
+
+@pytest.fixture
+def kepost_procedure(temp_dir):
+    input_dir = temp_dir / "input"
+    output_dir = temp_dir / "output"
+    logging_dir = temp_dir / "logs"
+    work_dir = temp_dir / "work"
+
+    input_dir.mkdir(parents=True, exist_ok=True)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    logging_dir.mkdir(parents=True, exist_ok=True)
+    work_dir.mkdir(parents=True, exist_ok=True)
+
+    config = {
+        "input_directory": str(input_dir),
+        "output_directory": str(output_dir),
+        "logging_directory": str(logging_dir),
+        "work_directory": str(work_dir),
+        "participant_label": ["test"],
+    }
+    return KePostProcedure(**config)
+
+
+def test_check_output_directory(kepost_procedure):
+    output_dir = Path(kepost_procedure.inputs.output_directory)
+    # Outputs of a partial run are not a finished run
+    (output_dir / "dataset_description.json").touch()
+    assert not kepost_procedure._check_output_directory()
+    (marker,) = kepost_procedure._completion_markers
+    Path(marker).touch()
+    assert kepost_procedure._check_output_directory()
+    kepost_procedure.inputs.force = True
+    assert not kepost_procedure._check_output_directory()
@@ -61,7 +61,23 @@ def test_default_config(keprep_procedure):
     assert configuration_dict["output_dir"] == str(
         keprep_procedure.inputs.output_directory
     )
-    assert configuration_dict["reset_database"] == True  # noqa: E712
+    assert configuration_dict["reset_database"] == False  # noqa: E712
+    assert Path(configuration_dict["bids_database_dir"]).parent == (
+        Path(keprep_procedure.inputs.work_directory) / "bids_db"
+    )
+    assert Path(configuration_dict["bids_database_dir"]).is_dir()
     assert configuration_dict["hires"] == True  # noqa: E712
     assert configuration_dict["do_reconall"] == True  # noqa: E712
     assert configuration_dict["dwi2t1w_dof"] == 6
+
+
+def test_check_output_directory(keprep_procedure):
+    output_dir = Path(keprep_procedure.inputs.output_directory)
+    # Outputs of a partial run are not a finished run
+    (output_dir / "dataset_description.json").touch()
+    assert not keprep_procedure._check_output_directory()
+    (marker,) = keprep_procedure._completion_markers
+    Path(marker).touch()
+    assert keprep_procedure._check_output_directory()
+    keprep_procedure.inputs.force = True
+    assert not keprep_procedure._check_output_directory()
@@ -1,3 +1,4 @@
+import copy
 import tempfile
 from pathlib import Path
 
@@ -69,3 +70,13 @@ def test_list_outputs(neuroflow_procedure):
     assert outputs["output_directory"] == str(
         neuroflow_procedure.inputs.output_directory
     )
+
+
+def test_command_line_follows_input_changes(neuroflow_procedure):
+    assert "--atlases fan2016,huang2022" in neuroflow_procedure.cmdline
+    neuroflow_procedure.inputs.atlases.append("schaefer2018")
+    assert "--atlases fan2016,huang2022,schaefer2018" in neuroflow_procedure.cmdline
+    copied = copy.deepcopy(neuroflow_procedure)
+    copied.inputs.max_bval = 2000
+    assert "--max_bval 2000" in copied.cmdline
+    assert "--max_bval 1000" in neuroflow_procedure.cmdline
@@ -0,0 +1,151 @@
+# tests/procedures/procedure/test_nipreps_procedure.py
+
+import os
+import tempfile
+from importlib.metadata import PackageNotFoundError
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
+
+import pytest
+from nipype.interfaces.base import Directory, File, Undefined, traits
+
+from yalab_procedures.procedures.base.nipreps_procedure import NiPrepsProcedure
+from yalab_procedures.procedures.base.procedure import (
+    ProcedureInputSpec,
+    ProcedureOutputSpec,
+)
+
+
+class FakePrepInputSpec(ProcedureInputSpec):
+    work_directory = Directory(mandatory=True, desc="Work directory")
+    fs_license_file = File(desc="FreeSurfer license file")
+    participant_label = traits.List(traits.Str, desc="Participant labels")
+    nprocs = traits.Int(desc="Number of processes")
+
+
+class FakePrepProcedure(NiPrepsProcedure):
+    input_spec = FakePrepInputSpec
+    output_spec = ProcedureOutputSpec
+    _inputs_mapping = {
+        "input_directory": "bids_dir",
+        "output_directory": "output_dir",
+        "work_directory": "work_dir",
+        "logging_directory": "log_dir",
+    }
+    _database_dir_key = "bids_database_dir"
+    _database_dir_name = "bids_db"
+
+    def _run_workflow(self, configuration_dict):
+        self.workflow_runs = getattr(self, "workflow_runs", 0) + 1
+        return "workflow"
+
+    def _generate_reports(self, workflow, configuration_dict):
+        def run_reports(output_dir, participant_label, run_uuid, **kwargs):
+            return participant_label == "bad"
+
+        self._run_reports(run_reports, configuration_dict["output_dir"], "uuid", None)
+
+
+@pytest.fixture
+def temp_dir():
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as temp_dir:
+        yield Path(temp_dir)
+
+
+@pytest.fixture
+def fake_procedure(temp_dir):
+    (temp_dir / "input").mkdir()
+    license_file = temp_dir / "license.txt"
+    license_file.touch()
+    return FakePrepProcedure(
+        input_directory=str(temp_dir / "input"),
+        output_directory=str(temp_dir / "output"),
+        logging_directory=str(temp_dir / "logs"),
+        work_directory=str(temp_dir / "work"),
+        fs_license_file=str(license_file),
+        participant_label=["good", "bad"],
+    )
+
+
+def test_version_is_resolved_lazily():
+    class MissingPackageProcedure(FakePrepProcedure):
+        _package = "yalab-procedures-missing-package"
+
+    assert FakePrepProcedure._version == "0.0.1"
+    with pytest.raises(PackageNotFoundError):
+        MissingPackageProcedure._version
+
+
+def test_nprocs_defaults_to_available_cpus(fake_procedure):
+    assert fake_procedure.inputs.nprocs >= 1
+
+
+def test_setup_config_toml(fake_procedure, temp_dir):
+    configuration_dict = fake_procedure._setup_config_toml()
+    assert configuration_dict["bids_dir"] == str(temp_dir / "input")
+    assert configuration_dict["participant_label"] == ["good", "bad"]
+    assert "fs_license_file" in configuration_dict
+    database_dir = Path(configuration_dict["bids_database_dir"])
+    assert database_dir.parent == temp_dir / "work" / "bids_db"
+    assert database_dir.is_dir()
+
+
+def test_database_dir_follows_input_dataset(fake_procedure, temp_dir):
+    database_dir = fake_procedure._setup_config_toml()["bids_database_dir"]
+    assert fake_procedure._setup_config_toml()["bids_database_dir"] == database_dir
+    (temp_dir / "input" / "sub-new").mkdir()
+    assert fake_procedure._setup_config_toml()["bids_database_dir"] != database_dir
+
+
+def test_completed_run_is_skipped(fake_procedure, temp_dir):
+    (temp_dir / "output").mkdir()
+    # Outputs of a partial run are not a finished run
+    (temp_dir / "output" / "dataset_description.json").touch()
+    assert not fake_procedure._check_output_directory()
+
+    fake_procedure.run_procedure()
+    assert all(Path(marker).exists() for marker in fake_procedure._completion_markers)
+    assert fake_procedure._check_output_directory()
+    fake_procedure.run_procedure()
+    assert fake_procedure.workflow_runs == 1
+
+    # A completed subset of the participants is not a completed run
+    fake_procedure.inputs.participant_label = ["good", "new"]
+    assert not fake_procedure._check_output_directory()
+    fake_procedure.inputs.participant_label = ["good"]
+    assert fake_procedure._check_output_directory()
+
+    fake_procedure.inputs.force = True
+    assert not fake_procedure._check_output_directory()
+
+
+def test_completed_run_is_skipped_before_license_lookup(fake_procedure, temp_dir):
+    (temp_dir / "output").mkdir()
+    fake_procedure.run_procedure()
+    fake_procedure.inputs.fs_license_file = Undefined
+    with patch.dict(os.environ, clear=True):
+        fake_procedure.run_procedure()
+    assert fake_procedure.workflow_runs == 1
+
+
+def test_workflow_runs_with_configured_plugin(fake_procedure):
+    plugin = {"plugin": "MultiProc", "plugin_args": {"n_procs": 2}}
+    config = SimpleNamespace(nipype=SimpleNamespace(get_plugin=lambda: plugin))
+    workflow = Mock()
+    fake_procedure._execute_workflow(workflow, config)
+    workflow.run.assert_called_once_with(**plugin)
+
+
+def test_failed_reports_are_logged(fake_procedure, temp_dir):
+    (temp_dir / "output").mkdir()
+    fake_procedure.run_procedure()
+    fake_procedure.stop_logging()
+    (log_file,) = (temp_dir / "logs").glob("*.log")
+    assert "Failed to generate report for subjects: bad" in log_file.read_text()
+
+
+def test_missing_input_directory(fake_procedure, temp_dir):
+    (temp_dir / "input").rmdir()
+    with pytest.raises(FileNotFoundError):
+        fake_procedure.run_procedure()
@@ -1,12 +1,28 @@
 # tests/procedures/procedure/test_procedure.py
 
+import gc
+import logging
+import os
+import shutil
+import sys
 import tempfile
+import threading
+import time
+import weakref
+from logging.handlers import QueueHandler
 from pathlib import Path
+from unittest.mock import patch
 
 import pytest
+from nipype.interfaces.base import Undefined
 
 from tests.procedures.procedure.mock_procedure import MockProcedure
-from yalab_procedures.procedures.base.procedure import Procedure
+from yalab_procedures.procedures.base.procedure import (
+    Procedure,
+    _available_cpus,
+    _read_finished_file,
+    _read_json,
+)
 
 
 @pytest.fixture
@@ -75,3 +91,331 @@ def test_naive_procedure(temp_dir):
     procedure = Procedure(**config)
     with pytest.raises(NotImplementedError):
         procedure.run()
+
+
+def test_rerun_is_skipped(temp_dir):
+    input_dir = temp_dir / "input"
+    output_dir = temp_dir / "output"
+    log_dir = temp_dir / "logs"
+    input_dir.mkdir(parents=True, exist_ok=True)
+
+    config = {
+        "input_directory": str(input_dir),
+        "output_directory": str(output_dir),
+        "logging_directory": str(log_dir),
+    }
+    MockProcedure(**config).run()
+    finished_files = list(log_dir.glob("*.done.json"))
+    assert len(finished_files) == 1
+    assert not list(log_dir.glob("*.tmp"))
+
+    procedure = MockProcedure(**config)
+    procedure.run()
+    finished_file, proceed = procedure._check_old_runs_finished()
+    assert finished_file == finished_files[0]
+    assert not proceed
+
+
+def test_force_rerun_removes_finished_file(temp_dir):
+    input_dir = temp_dir / "input"
+    log_dir = temp_dir / "logs"
+    input_dir.mkdir(parents=True, exist_ok=True)
+
+    config = {
+        "input_directory": str(input_dir),
+        "output_directory": str(temp_dir / "output"),
+        "logging_directory": str(log_dir),
+        "force": True,
+    }
+    procedure = MockProcedure(**config)
+    finished_file, proceed = procedure._check_old_runs_finished()
+    assert proceed
+    assert not finished_file.exists()
+
+    procedure.run()
+    assert finished_file.exists()
+    finished_file, proceed = procedure._check_old_runs_finished()
+    assert proceed
+    assert not finished_file.exists()
+
+
+def test_logging_handlers_not_duplicated(temp_dir):
+    input_dir = temp_dir / "input"
+    input_dir.mkdir(parents=True, exist_ok=True)
+
+    for run_name in ["first", "second"]:
+        procedure = MockProcedure(
+            input_directory=str(input_dir),
+            output_directory=str(temp_dir / run_name / "output"),
+            logging_directory=str(temp_dir / run_name / "logs"),
+        )
+        procedure.run()
+
+    log_files = list((temp_dir / "second" / "logs").glob("*.log"))
+    assert len(log_files) == 1
+    log_content = log_files[0].read_text()
+    assert log_content.count("Running the mock procedure") == 1
+    assert not any(
+        isinstance(handler, QueueHandler) for handler in procedure.logger.handlers
+    )
+
+
+def test_run_command_streams_output(mock_procedure, temp_dir):
+    mock_procedure.inputs.logging_directory = str(temp_dir / "logs")
+    mock_procedure.setup_logging()
+    command = [
+        sys.executable,
+        "-c",
+        "import sys; print('to stdout'); print('to stderr', file=sys.stderr)",
+    ]
+    result = mock_procedure._run_command(command)
+    mock_procedure.stop_logging()
+
+    assert result.returncode == 0
+    assert result.stdout == "to stdout\n"
+    assert result.stderr == "to stderr\n"
+    log_content = Path(mock_procedure.log_file_path).read_text()
+    assert "INFO - to stdout" in log_content
+    assert "INFO - to stderr" in log_content
+    assert "ERROR" not in log_content
+
+
+def test_logging_is_lazy(mock_procedure, temp_dir):
+    log_dir = temp_dir / "logs"
+    assert not log_dir.exists()
+    mock_procedure.logger.info("First message")
+    mock_procedure.stop_logging()
+    log_files = list(log_dir.glob("*.log"))
+    assert len(log_files) == 1
+    assert "First message" in log_files[0].read_text()
+
+
+def test_root_logging_is_untouched(mock_procedure):
+    root_handler = logging.NullHandler()
+    logging.root.addHandler(root_handler)
+    try:
+        mock_procedure.run()
+        assert root_handler in logging.root.handlers
+    finally:
+        logging.root.removeHandler(root_handler)
+
+
+def test_sessions(mock_procedure):
+    input_dir = Path(mock_procedure.inputs.input_directory)
+    for name in ["ses-01", "ses-02"]:
+        (input_dir / name).mkdir()
+    (input_dir / "ses-03.json").touch()
+    (input_dir / "anat").mkdir()
+    assert sorted(mock_procedure.sessions) == ["01", "02"]
+
+
+def test_sessions_without_input_directory(mock_procedure, temp_dir):
+    shutil.rmtree(temp_dir / "input")
+    assert mock_procedure.sessions == []
+    mock_procedure.inputs.input_directory = Undefined
+    assert mock_procedure.sessions == []
+
+
+def test_get_default_value(mock_procedure):
+    assert mock_procedure._get_default_value("force") is False
+    mock_procedure.inputs.force = True
+    assert mock_procedure._get_default_value("force") is True
+
+
+def test_sessions_cache_follows_directory_mtime(mock_procedure):
+    input_dir = Path(mock_procedure.inputs.input_directory)
+    (input_dir / "ses-01").mkdir()
+    assert mock_procedure.sessions == ["01"]
+    (input_dir / "ses-02").mkdir()
+    stat = input_dir.stat()
+    os.utime(input_dir, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert sorted(mock_procedure.sessions) == ["01", "02"]
+
+
+def test_available_cpus():
+    assert 1 <= _available_cpus() <= os.cpu_count()
+
+
+def test_read_json_sees_same_size_rewrite(temp_dir):
+    json_file = temp_dir / "finished.json"
+    json_file.write_text('{"run": 1}')
+    stat = json_file.stat()
+    assert _read_json(json_file) == {"run": 1}
+    json_file.write_text('{"run": 2}')
+    os.utime(json_file, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert _read_json(json_file) == {"run": 2}
+
+
+def test_finished_file_is_parsed_once_while_unchanged(temp_dir):
+    finished_file = temp_dir / "MockProcedure.done.json"
+    finished_file.write_text('{"config": {"output_directory": "/first"}}')
+    with patch(
+        "yalab_procedures.procedures.base.procedure._read_json", wraps=_read_json
+    ) as read_json:
+        assert _read_finished_file(finished_file)["config"]["output_directory"] == (
+            "/first"
+        )
+        _read_finished_file(finished_file)
+        assert read_json.call_count == 1
+
+        # A replacement of the same size and mtime is still seen
+        stat = finished_file.stat()
+        replacement = temp_dir / "replacement.json"
+        replacement.write_text('{"config": {"output_directory": "/other"}}')
+        os.utime(replacement, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        os.replace(replacement, finished_file)
+        assert _read_finished_file(finished_file)["config"]["output_directory"] == (
+            "/other"
+        )
+        assert read_json.call_count == 2
+
+
+def test_logging_directory_recreated(mock_procedure, temp_dir):
+    log_dir = temp_dir / "logs"
+    mock_procedure.setup_logging()
+    mock_procedure.stop_logging()
+    shutil.rmtree(log_dir)
+    mock_procedure.setup_logging()
+    mock_procedure.stop_logging()
+    assert len(list(log_dir.glob("*.log"))) == 1
+
+
+def test_log_listener_is_shared(temp_dir):
+    input_dir = temp_dir / "input"
+    input_dir.mkdir()
+    threads_before = threading.active_count()
+    procedures = [
+        MockProcedure(
+            input_directory=str(input_dir),
+            output_directory=str(temp_dir / name / "output"),
+        )
+        for name in ["first", "second", "third"]
+    ]
+    for procedure in procedures:
+        procedure.logger.info("Started")
+    assert threading.active_count() == threads_before + 1
+    for procedure in procedures:
+        procedure.stop_logging()
+    assert threading.active_count() == threads_before
+    for name in ["first", "second", "third"]:
+        (log_file,) = (temp_dir / name / "logs").glob("*.log")
+        assert "Started" in log_file.read_text()
+
+
+def test_log_file_is_written_during_run(mock_procedure):
+    mock_procedure.logger.info("While running")
+    deadline = time.monotonic() + 10
+    while "While running" not in Path(mock_procedure.log_file_path).read_text():
+        assert time.monotonic() < deadline, "Record was not flushed"
+        time.sleep(0.01)
+    mock_procedure.stop_logging()
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requires os.fork")
+def test_logging_in_forked_child(temp_dir):
+    input_dir = temp_dir / "input"
+    input_dir.mkdir()
+    parent, child = (
+        MockProcedure(
+            input_directory=str(input_dir),
+            output_directory=str(temp_dir / name / "output"),
+        )
+        for name in ["parent", "child"]
+    )
+    parent.logger.info("From the parent")
+    pid = os.fork()
+    if pid == 0:
+        exit_code = 1
+        try:
+            child.logger.info("From the child")
+            child.stop_logging()
+            exit_code = 0
+        finally:
+            os._exit(exit_code)
+    deadline = time.monotonic() + 30
+    while True:
+        done, status = os.waitpid(pid, os.WNOHANG)
+        if done:
+            break
+        if time.monotonic() > deadline:
+            os.kill(pid, 9)
+            os.waitpid(pid, 0)
+            pytest.fail("Logging in the forked child hung")
+        time.sleep(0.01)
+    assert os.waitstatus_to_exitcode(status) == 0
+    parent.stop_logging()
+
+    (parent_log,) = (temp_dir / "parent" / "logs").glob("*.log")
+    (child_log,) = (temp_dir / "child" / "logs").glob("*.log")
+    assert parent_log.read_text().count("From the parent") == 1
+    assert "From the child" in child_log.read_text()
+    # The child's counter continues from the parent's, its process ID does not
+    assert f"_{pid}_" in child_log.name
+
+
+def test_procedure_logs_are_separate(temp_dir):
+    input_dir = temp_dir / "input"
+    input_dir.mkdir()
+    first, second = (
+        MockProcedure(
+            input_directory=str(input_dir),
+            output_directory=str(temp_dir / name / "output"),
+        )
+        for name in ["first", "second"]
+    )
+    first.logger.info("From the first procedure")
+    second.run()
+    first.stop_logging()
+
+    (first_log,) = (temp_dir / "first" / "logs").glob("*.log")
+    (second_log,) = (temp_dir / "second" / "logs").glob("*.log")
+    assert "Running the mock procedure" not in first_log.read_text()
+    assert "From the first procedure" not in second_log.read_text()
+    assert second.logger.name not in logging.Logger.manager.loggerDict
+
+
+def test_procedure_logger_is_collected(temp_dir):
+    (temp_dir / "input").mkdir()
+    procedure = MockProcedure(
+        input_directory=str(temp_dir / "input"),
+        output_directory=str(temp_dir / "output"),
+    )
+    procedure.run()
+    logger = weakref.ref(procedure.logger)
+    assert logger().parent is logging.getLogger("MockProcedure")
+    del procedure
+    gc.collect()
+    assert logger() is None
+
+
+def test_logging_after_run_propagates(mock_procedure, caplog):
+    mock_procedure.run()
+    with caplog.at_level(logging.INFO):
+        mock_procedure.logger.info("After the run")
+    assert "After the run" in caplog.text
+
+
+class InferringProcedure(MockProcedure):
+    def run_procedure(self, **kwargs):
+        super().run_procedure(**kwargs)
+        self.inputs.logging_level = "WARNING"
+
+
+def test_finished_file_records_final_inputs(temp_dir):
+    input_dir = temp_dir / "input"
+    log_dir = temp_dir / "logs"
+    input_dir.mkdir()
+    InferringProcedure(
+        input_directory=str(input_dir),
+        output_directory=str(temp_dir / "output"),
+        logging_directory=str(log_dir),
+    ).run()
+    (finished_file,) = log_dir.glob("*.done.json")
+    assert _read_json(finished_file)["config"]["logging_level"] == "WARNING"
+
+
+def test_inputs_are_read_once_per_run(mock_procedure):
+    spec = type(mock_procedure.inputs)
+    with patch.object(spec, "get", autospec=True, side_effect=spec.get) as get:
+        mock_procedure.run()
+    assert get.call_count == 1